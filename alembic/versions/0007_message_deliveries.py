@@ -0,0 +1,42 @@
+"""per-recipient delivery ledger
+
+Revision ID: 0007_message_deliveries
+Revises: 0006_action_and_reminders
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0007_message_deliveries"
+down_revision: Union[str, Sequence[str], None] = "0006_action_and_reminders"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "message_deliveries",
+        sa.Column(
+            "schedule_message_id",
+            sa.Integer(),
+            sa.ForeignKey("schedule_messages.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column(
+            "user_id",
+            sa.Integer(),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("status", sa.String(), nullable=False, server_default="pending"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.text("now()")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("message_deliveries")
@@ -0,0 +1,52 @@
+"""indexes for scheduler, reminder and admin queries
+
+Revision ID: 0008_hot_path_indexes
+Revises: 0007_message_deliveries
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0008_hot_path_indexes"
+down_revision: Union[str, Sequence[str], None] = "0007_message_deliveries"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # send_daily: send_date = :today AND sent_at IS NULL
+    op.create_index(
+        "ix_schedule_messages_send_date_unsent",
+        "schedule_messages",
+        ["send_date"],
+        postgresql_where=sa.text("sent_at IS NULL"),
+    )
+    # send_outbox: sent_at IS NULL AND send_at <= :now ORDER BY send_at, id
+    op.create_index(
+        "ix_schedule_messages_send_at_unsent",
+        "schedule_messages",
+        ["send_at", "id"],
+        postgresql_where=sa.text("sent_at IS NULL AND send_at IS NOT NULL"),
+    )
+    # keyset-обход получателей рассылки
+    op.create_index(
+        "ix_users_id_consent",
+        "users",
+        ["id"],
+        postgresql_where=sa.text("consent IS true"),
+    )
+    op.create_index("ix_subscriptions_user_id", "subscriptions", ["user_id"])
+    op.create_index("ix_inbox_messages_user_created", "inbox_messages", ["user_id", "created_at"])
+    op.create_index("ix_action_events_user_created", "action_events", ["user_id", "created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_action_events_user_created", table_name="action_events")
+    op.drop_index("ix_inbox_messages_user_created", table_name="inbox_messages")
+    op.drop_index("ix_subscriptions_user_id", table_name="subscriptions")
+    op.drop_index("ix_users_id_consent", table_name="users")
+    op.drop_index("ix_schedule_messages_send_at_unsent", table_name="schedule_messages")
+    op.drop_index("ix_schedule_messages_send_date_unsent", table_name="schedule_messages")
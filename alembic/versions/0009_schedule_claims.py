@@ -0,0 +1,26 @@
+"""lease columns for multi-worker schedule dispatch
+
+Revision ID: 0009_schedule_claims
+Revises: 0008_hot_path_indexes
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0009_schedule_claims"
+down_revision: Union[str, Sequence[str], None] = "0008_hot_path_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("schedule_messages", sa.Column("claimed_by", sa.String(), nullable=True))
+    op.add_column("schedule_messages", sa.Column("claimed_until", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("schedule_messages", "claimed_until")
+    op.drop_column("schedule_messages", "claimed_by")
@@ -0,0 +1,86 @@
+"""compressed raw payload for inbox messages
+
+Revision ID: 0010_inbox_raw_payload
+Revises: 0009_schedule_claims
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+import json
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0010_inbox_raw_payload"
+down_revision: Union[str, Sequence[str], None] = "0009_schedule_claims"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+inbox = sa.table(
+    "inbox_messages",
+    sa.column("id", sa.Integer),
+    sa.column("raw", sa.Text),
+    sa.column("raw_payload", sa.LargeBinary),
+)
+
+
+def _convert(source, convert):
+    """
+    Перекладывает raw <-> raw_payload пачками по id, чтобы не держать
+    в памяти всю таблицу.
+    """
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(inbox.c.id, source)
+            .where(inbox.c.id > last_id)
+            .where(source.is_not(None))
+            .order_by(inbox.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        bind.execute(
+            sa.update(inbox)
+            .where(inbox.c.id == sa.bindparam("b_id"))
+            .values(raw=sa.bindparam("b_raw"), raw_payload=sa.bindparam("b_payload")),
+            [{"b_id": row[0], **convert(row[1])} for row in rows],
+        )
+        last_id = rows[-1][0]
+
+
+def _drop_nulls(value):
+    if isinstance(value, dict):
+        return {k: _drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_drop_nulls(v) for v in value]
+    return value
+
+
+def _compress(raw):
+    # как и новые записи: JSON без null-полей, затем zlib
+    try:
+        raw = json.dumps(_drop_nulls(json.loads(raw)), ensure_ascii=False, separators=(",", ":"))
+    except ValueError:
+        pass
+    return {"b_raw": None, "b_payload": zlib.compress(raw.encode(), 6)}
+
+
+def upgrade() -> None:
+    op.add_column("inbox_messages", sa.Column("raw_payload", sa.LargeBinary(), nullable=True))
+    _convert(inbox.c.raw, _compress)
+
+
+def downgrade() -> None:
+    def decode(payload):
+        try:
+            return {"b_raw": zlib.decompress(payload).decode(), "b_payload": None}
+        except zlib.error:
+            return {"b_raw": None, "b_payload": None}
+
+    _convert(inbox.c.raw_payload, decode)
+    op.drop_column("inbox_messages", "raw_payload")
@@ -0,0 +1,31 @@
+"""index for the pending proofs review queue
+
+Revision ID: 0011_review_queue_index
+Revises: 0010_inbox_raw_payload
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0011_review_queue_index"
+down_revision: Union[str, Sequence[str], None] = "0010_inbox_raw_payload"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # очередь проверки: action_status = 'pending' AND (created_at, id) > :cursor
+    # обычные сообщения (action_status IS NULL) в индекс не попадают
+    op.create_index(
+        "ix_inbox_messages_status_created",
+        "inbox_messages",
+        ["action_status", "created_at", "id"],
+        postgresql_where=sa.text("action_status IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inbox_messages_status_created", table_name="inbox_messages")
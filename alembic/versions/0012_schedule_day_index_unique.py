@@ -0,0 +1,40 @@
+"""unique day_index for set-based seeding
+
+Revision ID: 0012_schedule_day_index_unique
+Revises: 0011_review_queue_index
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0012_schedule_day_index_unique"
+down_revision: Union[str, Sequence[str], None] = "0011_review_queue_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # у дублей day_index оставляем номер только самой ранней строке,
+    # остальные строки не удаляем — у них могут быть доставки
+    op.execute(sa.text(
+        """
+        UPDATE schedule_messages AS sm
+        SET day_index = NULL
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY day_index ORDER BY id) AS rn
+            FROM schedule_messages
+            WHERE day_index IS NOT NULL
+        ) AS dup
+        WHERE sm.id = dup.id AND dup.rn > 1
+        """
+    ))
+    op.create_unique_constraint(
+        "uq_schedule_messages_day_index", "schedule_messages", ["day_index"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("uq_schedule_messages_day_index", "schedule_messages", type_="unique")
@@ -0,0 +1,29 @@
+"""content hash of the last applied seed
+
+Revision ID: 0013_seed_metadata
+Revises: 0012_schedule_day_index_unique
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0013_seed_metadata"
+down_revision: Union[str, Sequence[str], None] = "0012_schedule_day_index_unique"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "seed_metadata",
+        sa.Column("key", sa.String(), primary_key=True),
+        sa.Column("content_hash", sa.String(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("seed_metadata")
@@ -0,0 +1,49 @@
+"""precomputed send_at for daily schedule messages
+
+Revision ID: 0014_schedule_send_plan
+Revises: 0013_seed_metadata
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import TIMEZONE, SEND_HOUR, SEND_MINUTE
+
+revision: str = "0014_schedule_send_plan"
+down_revision: Union[str, Sequence[str], None] = "0013_seed_metadata"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ежедневные сообщения с сегодняшнего дня встают в очередь send_at;
+    # прошедшие не планируем, чтобы очередь не разослала их разом
+    op.execute(
+        sa.text(
+            """
+            UPDATE schedule_messages
+            SET send_at = ((send_date + make_time(:hour, :minute, 0)) AT TIME ZONE :tz) AT TIME ZONE 'UTC'
+            WHERE sent_at IS NULL
+              AND send_at IS NULL
+              AND send_date >= (now() AT TIME ZONE :tz)::date
+            """
+        ).bindparams(tz=TIMEZONE, hour=SEND_HOUR, minute=SEND_MINUTE)
+    )
+
+
+def downgrade() -> None:
+    # до этой ревизии send_at был только у отложенных сообщений /outbox
+    op.execute(
+        sa.text(
+            """
+            UPDATE schedule_messages
+            SET send_at = NULL
+            WHERE sent_at IS NULL
+              AND COALESCE(attempts, 0) = 0
+              AND send_at = ((send_date + make_time(:hour, :minute, 0)) AT TIME ZONE :tz) AT TIME ZONE 'UTC'
+            """
+        ).bindparams(tz=TIMEZONE, hour=SEND_HOUR, minute=SEND_MINUTE)
+    )
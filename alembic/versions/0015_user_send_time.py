@@ -0,0 +1,36 @@
+"""per-user send time and bucketed delivery due time
+
+Revision ID: 0015_user_send_time
+Revises: 0014_schedule_send_plan
+Create Date: 2024-01-01 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0015_user_send_time"
+down_revision: Union[str, Sequence[str], None] = "0014_schedule_send_plan"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("timezone", sa.String(), nullable=True))
+    op.add_column("users", sa.Column("send_hour", sa.Integer(), nullable=True))
+    op.add_column("message_deliveries", sa.Column("due_at", sa.DateTime(), nullable=True))
+    # следующая минута рассылки: min(due_at) среди pending одного сообщения
+    op.create_index(
+        "ix_message_deliveries_pending_due",
+        "message_deliveries",
+        ["schedule_message_id", "due_at"],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_message_deliveries_pending_due", table_name="message_deliveries")
+    op.drop_column("message_deliveries", "due_at")
+    op.drop_column("users", "send_hour")
+    op.drop_column("users", "timezone")
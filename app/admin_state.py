@@ -0,0 +1,66 @@
+import time
+
+import redis.asyncio as aioredis
+from aiogram import Bot
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+
+from app.config import FSM_STORAGE, FSM_STATE_TTL_SECONDS, REDIS_URL
+
+
+class AdminStates(StatesGroup):
+    tomorrow = State()
+    compliment = State()
+
+
+class TTLMemoryStorage(MemoryStorage):
+    """
+    MemoryStorage, у которого состояние истекает через ttl секунд,
+    как state_ttl у RedisStorage.
+    """
+
+    def __init__(self, ttl: float = FSM_STATE_TTL_SECONDS):
+        super().__init__()
+        self.ttl = ttl
+        self._expires = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await super().set_state(key, state)
+        self._expires[key] = time.monotonic() + self.ttl
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._expires[key]
+            await super().set_state(key, None)
+        return await super().get_state(key)
+
+
+def make_storage(kind: str = FSM_STORAGE) -> BaseStorage:
+    """
+    memory — один процесс; redis — состояние общее для всех реплик бота
+    и переживает рестарт.
+    """
+    if kind == "redis":
+        return RedisStorage(
+            aioredis.from_url(REDIS_URL),
+            state_ttl=FSM_STATE_TTL_SECONDS,
+            data_ttl=FSM_STATE_TTL_SECONDS,
+        )
+    return TTLMemoryStorage()
+
+
+fsm_storage = make_storage()
+
+
+def admin_context(bot: Bot, user_id: int, storage: BaseStorage | None = None) -> FSMContext:
+    """
+    Контекст диалога админа. Хранилище читается только для админа, а не
+    middleware на каждый апдейт: горячий путь inbox не ходит в Redis.
+    Ключ — пользователь, чтобы сообщение и callback попадали в одно состояние.
+    """
+    key = StorageKey(bot_id=bot.id, chat_id=user_id, user_id=user_id)
+    return FSMContext(storage=storage or fsm_storage, key=key)
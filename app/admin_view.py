@@ -0,0 +1,182 @@
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import select, func, literal_column, true, type_coerce
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.types import JSON
+
+from app.config import ADMIN_STATUS_PAGE_SIZE
+from app.models import User, Subscription, InboxMessage, ActionEvent, ActionRule
+
+AdminUserView = namedtuple(
+    "AdminUserView",
+    ["id", "tg_user_id", "tg_chat_id", "consent", "expires_at", "pending_proofs", "events"],
+)
+AdminEventView = namedtuple("AdminEventView", ["created_at", "title", "new_expires_at"])
+
+# лимит Telegram на текст сообщения — в UTF-16 code units, не в символах
+MESSAGE_MAX = 4096
+EVENT_TITLE_MAX = 64
+INBOX_PAGE_SIZE = 10
+
+
+def admin_overview_query(after_id: int = 0, limit: int = ADMIN_STATUS_PAGE_SIZE, events_limit: int = 5):
+    """
+    Сводка для админа одним запросом: по странице пользователей (keyset
+    по users.id) — подписка, число непроверенных доказательств и последние
+    действия через LATERAL-подзапросы, каждый из которых идет по индексу
+    своей таблицы.
+    """
+    sub = (
+        select(func.max(Subscription.expires_at).label("expires_at"))
+        .where(Subscription.user_id == User.id)
+        .lateral("sub")
+    )
+    pending = (
+        select(func.count().label("pending_proofs"))
+        .where(InboxMessage.user_id == User.id)
+        .where(InboxMessage.action_status == "pending")
+        .lateral("pending")
+    )
+    recent = (
+        select(ActionEvent.created_at, ActionEvent.new_expires_at, ActionRule.title)
+        .join(ActionRule, ActionRule.id == ActionEvent.rule_id)
+        .where(ActionEvent.user_id == User.id)
+        .order_by(ActionEvent.created_at.desc())
+        .limit(events_limit)
+        .correlate(User)
+        .subquery("recent")
+    )
+    events = (
+        select(
+            func.coalesce(
+                func.json_agg(aggregate_order_by(
+                    func.json_build_array(recent.c.created_at, recent.c.title, recent.c.new_expires_at),
+                    recent.c.created_at.desc(),
+                )),
+                literal_column("'[]'::json"),
+            ).label("events")
+        )
+        .select_from(recent)
+        .lateral("events")
+    )
+    return (
+        select(
+            User.id,
+            User.tg_user_id,
+            User.tg_chat_id,
+            User.consent,
+            sub.c.expires_at,
+            pending.c.pending_proofs,
+            type_coerce(events.c.events, JSON),
+        )
+        .select_from(User)
+        .outerjoin(sub, true())
+        .outerjoin(pending, true())
+        .outerjoin(events, true())
+        .where(User.id > after_id)
+        .order_by(User.id)
+        .limit(limit)
+    )
+
+
+def _parse_dt(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+async def load_admin_overview(session, after_id: int = 0, limit: int = ADMIN_STATUS_PAGE_SIZE):
+    rows = (await session.execute(admin_overview_query(after_id, limit))).all()
+    return [
+        AdminUserView(
+            id=row[0],
+            tg_user_id=row[1],
+            tg_chat_id=row[2],
+            consent=row[3],
+            expires_at=row[4],
+            pending_proofs=row[5],
+            events=[
+                AdminEventView(_parse_dt(created_at), title, _parse_dt(new_expires_at))
+                for created_at, title, new_expires_at in row[6] or []
+            ],
+        )
+        for row in rows
+    ]
+
+
+def render_user_status(view: AdminUserView) -> str:
+    expires = view.expires_at.strftime("%Y-%m-%d %H:%M") if view.expires_at else "нет"
+    lines = [
+        f"Пользователь #{view.id} (tg {view.tg_user_id}, consent: {'да' if view.consent else 'нет'})",
+        f"Подписка до: {expires}",
+        f"Ждут проверки: {view.pending_proofs}",
+    ]
+    if view.events:
+        lines.append("Последние действия:")
+        for event in view.events:
+            when = event.created_at.strftime("%Y-%m-%d %H:%M") if event.created_at else "?"
+            new_exp = event.new_expires_at.strftime("%Y-%m-%d %H:%M") if event.new_expires_at else "нет"
+            title = event.title or ""
+            if len(title) > EVENT_TITLE_MAX:
+                title = f"{title[:EVENT_TITLE_MAX - 3]}..."
+            lines.append(f"- {when}: {title} -> до {new_exp}")
+    return "\n".join(lines)
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def cut_utf16(text: str, limit: int) -> str:
+    # режем по символам, не разрывая суррогатные пары
+    out, size = [], 0
+    for char in text:
+        size += utf16_len(char)
+        if size > limit:
+            break
+        out.append(char)
+    return "".join(out)
+
+
+def split_messages(parts, sep: str = "\n\n", limit: int = MESSAGE_MAX) -> list[str]:
+    """
+    Склеивает куски через sep в сообщения не длиннее limit UTF-16 units;
+    кусок не делится между сообщениями, слишком длинный обрезается.
+    """
+    chunks, current, size = [], [], 0
+    sep_len = utf16_len(sep)
+    for part in parts:
+        part_len = utf16_len(part)
+        if part_len > limit:
+            part = cut_utf16(part, limit)
+            part_len = utf16_len(part)
+        if current and size + sep_len + part_len > limit:
+            chunks.append(sep.join(current))
+            current, size = [], 0
+        size += part_len + (sep_len if current else 0)
+        current.append(part)
+    if current:
+        chunks.append(sep.join(current))
+    return chunks
+
+
+def recent_inbox_query(limit: int = INBOX_PAGE_SIZE):
+    """
+    Последние сообщения всех пользователей одним запросом, вместе с
+    tg id отправителя и raw payload (для describe_raw). Порядок по id: идет по первичному ключу, без
+    сортировки всей таблицы.
+    """
+    return (
+        select(
+            InboxMessage.id,
+            InboxMessage.created_at,
+            InboxMessage.text,
+            InboxMessage.media_type,
+            InboxMessage.media_file_id,
+            InboxMessage.raw,
+            InboxMessage.raw_payload,
+            User.tg_user_id,
+        )
+        .join(User, User.id == InboxMessage.user_id)
+        .order_by(InboxMessage.id.desc())
+        .limit(limit)
+    )
@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, desc
+
+from app.admin_view import admin_overview_query
+from app.db import Base, make_engine
+from app.models import User, Subscription, InboxMessage, ActionEvent, ActionRule
+from app.review_queue import Cursor, pending_proofs_query
+from app.scheduler import due_outbox_query, due_reminders_query
+from app.send_plan import bring_forward_statement
+
+BENCH_SCHEMA = "bench_query_plans"
+
+SEED_SQL = [
+    """
+    INSERT INTO users (id, tg_user_id, tg_chat_id, consent, created_at, last_activity_at)
+    SELECT i, 1000000 + i, 1000000 + i, i % 10 <> 0,
+           now() - (i % 400) * interval '1 day',
+           now() - (i % 30) * interval '1 day'
+    FROM generate_series(1, :users) AS i
+    """,
+    """
+    INSERT INTO schedule_messages (id, day_index, send_date, type, text, sent_at, send_at)
+    SELECT i, i, current_date - :days / 2 + i, 'daily', 'text ' || i,
+           CASE WHEN i < :days / 2 THEN now() END,
+           CASE WHEN i >= :days / 2 THEN current_date - :days / 2 + i + interval '10 hours' END
+    FROM generate_series(1, :days) AS i
+    """,
+    """
+    INSERT INTO subscriptions (user_id, expires_at)
+    SELECT i, now() + (i % 60 - 10) * interval '1 day'
+    FROM generate_series(1, :users) AS i
+    """,
+    """
+    INSERT INTO action_rules (id, key, title, days_to_extend)
+    SELECT i, 'rule' || i, 'Rule ' || i, 30 FROM generate_series(1, 4) AS i
+    """,
+    """
+    INSERT INTO inbox_messages (user_id, tg_message_id, text, media_type, media_file_id, action_status, created_at)
+    SELECT i % :users + 1, i, 'hi',
+           CASE WHEN i % 4 = 0 THEN 'photo' END,
+           CASE WHEN i % 4 = 0 THEN 'file' || i END,
+           CASE WHEN i % 40 = 0 THEN 'pending' WHEN i % 4 = 0 THEN 'approved' END,
+           now() - (i % 1000) * interval '1 hour'
+    FROM generate_series(1, :users * 5) AS i
+    """,
+    """
+    INSERT INTO action_events (user_id, rule_id, created_at)
+    SELECT i % :users + 1, i % 4 + 1, now() - (i % 1000) * interval '1 hour'
+    FROM generate_series(1, :users * 2) AS i
+    """,
+]
+
+
+def bench_queries(users: int):
+    now = datetime.utcnow()
+    probe_user = users // 2
+    # (название, запрос, таблица, которая должна читаться по индексу или None)
+    return [
+        ("send_outbox due batch", due_outbox_query(now, 20), "schedule_messages"),
+        ("send_daily bring forward", bring_forward_statement(now.date(), now), "schedule_messages"),
+        (
+            "recipients keyset page",
+            select(User.id, User.tg_chat_id)
+            .where(User.consent.is_(True))
+            .where(User.id > probe_user)
+            .order_by(User.id)
+            .limit(1000),
+            "users",
+        ),
+        (
+            "subscription by user",
+            select(Subscription).where(Subscription.user_id == probe_user),
+            "subscriptions",
+        ),
+        (
+            "proofs by user",
+            select(InboxMessage)
+            .where(InboxMessage.user_id == probe_user)
+            .where(InboxMessage.media_file_id.isnot(None))
+            .order_by(InboxMessage.created_at.desc())
+            .limit(10),
+            "inbox_messages",
+        ),
+        (
+            "status events by user",
+            select(ActionEvent, ActionRule)
+            .join(ActionRule, ActionRule.id == ActionEvent.rule_id)
+            .where(ActionEvent.user_id == probe_user)
+            .order_by(desc(ActionEvent.created_at))
+            .limit(5),
+            "action_events",
+        ),
+        ("admin overview page", admin_overview_query(after_id=probe_user), "action_events"),
+        (
+            "review queue page",
+            pending_proofs_query(Cursor(now - timedelta(days=1), probe_user)),
+            "inbox_messages",
+        ),
+        (
+            "send_reminders due page",
+            due_reminders_query(now + timedelta(days=1))
+            .where(User.id > probe_user)
+            .order_by(User.id)
+            .limit(1000),
+            "subscriptions",
+        ),
+    ]
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def check_plan(plan, table):
+    nodes = list(plan_nodes(plan))
+    scans = [
+        (n["Node Type"], n.get("Relation Name"), n.get("Index Name"))
+        for n in nodes
+        if "Scan" in n["Node Type"]
+    ]
+    if table is None:
+        return True, scans
+    # у Bitmap Index Scan нет Relation Name, поэтому индекс узнаем по имени
+    uses_index = any(idx and (rel == table or table in idx) for _, rel, idx in scans)
+    seq_scan = any(node == "Seq Scan" and rel == table for node, rel, _ in scans)
+    return uses_index and not seq_scan, scans
+
+
+async def run(users: int, days: int) -> bool:
+    engine = make_engine()
+    ok = True
+    try:
+        async with engine.connect() as conn:
+            trans = await conn.begin()
+            try:
+                await conn.exec_driver_sql(f"CREATE SCHEMA {BENCH_SCHEMA}")
+                await conn.exec_driver_sql(f"SET LOCAL search_path TO {BENCH_SCHEMA}")
+                await conn.run_sync(Base.metadata.create_all)
+
+                started = time.perf_counter()
+                for sql in SEED_SQL:
+                    sql = sql.replace(":users", str(users)).replace(":days", str(days))
+                    await conn.exec_driver_sql(sql)
+                await conn.exec_driver_sql("ANALYZE")
+                print(f"seeded {users} users / {days} messages in {time.perf_counter() - started:.1f}s")
+
+                for name, query, table in bench_queries(users):
+                    sql = str(query.compile(
+                        dialect=conn.dialect,
+                        compile_kwargs={"literal_binds": True},
+                    ))
+                    result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")
+                    raw = result.scalar()
+                    explain = (json.loads(raw) if isinstance(raw, str) else raw)[0]
+                    passed, scans = check_plan(explain["Plan"], table)
+                    ok = ok and passed
+                    status = "ok " if passed else "FAIL"
+                    scans_txt = ", ".join(
+                        f"{node} {rel or ''}{' using ' + idx if idx else ''}".strip()
+                        for node, rel, idx in scans
+                    )
+                    print(f"[{status}] {name:<26} {explain['Execution Time']:8.2f} ms  {scans_txt}")
+            finally:
+                # все данные бенчмарка живут только внутри транзакции
+                await trans.rollback()
+    finally:
+        await engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Seed a throwaway schema and check that hot queries use index scans."
+    )
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=3650)
+    args = parser.parse_args()
+
+    ok = asyncio.run(run(args.users, args.days))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
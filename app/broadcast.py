@@ -0,0 +1,173 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from aiogram.exceptions import (
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+)
+
+from app.config import BROADCAST_CONCURRENCY, BROADCAST_PREPARED
+from app.prepared import PreparedMessage
+from app.sender import BotSender
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_SENT = "sent"
+STATUS_BLOCKED = "blocked"
+STATUS_FAILED = "failed"
+
+
+@dataclass
+class BroadcastResult:
+    delivered: int = 0
+    blocked: int = 0
+    failed: int = 0
+
+    def add(self, status: str):
+        if status == STATUS_SENT:
+            self.delivered += 1
+        elif status == STATUS_BLOCKED:
+            self.blocked += 1
+        else:
+            self.failed += 1
+
+    @property
+    def total(self) -> int:
+        return self.delivered + self.blocked + self.failed
+
+
+class Broadcaster:
+    """
+    Рассылка текста списку получателей (user_id, chat_id)
+    пулом из concurrency воркеров с глобальным и per-chat лимитами.
+    """
+
+    def __init__(
+        self,
+        bot,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        sender: BotSender | None = None,
+        prepared: bool = BROADCAST_PREPARED,
+    ):
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.sender = sender or BotSender(bot)
+        self.prepared = prepared
+
+    def prepare(self, text: str):
+        """
+        Общий текст рассылки сериализуется один раз (PreparedMessage),
+        если сессия бота это позволяет; иначе остается строкой.
+        """
+        if self.prepared and text is not None and PreparedMessage.supported(self.bot):
+            return PreparedMessage(self.bot, text)
+        return text
+
+    async def send(self, chat_id: int, text):
+        if isinstance(text, PreparedMessage):
+            return await self.sender.send_prepared(chat_id, text)
+        return await self.sender.send_message(chat_id, text)
+
+    async def _deliver(self, user_id, chat_id, text, log_prefix):
+        try:
+            logger.debug(
+                "%s: sending to user_id=%s chat_id=%s",
+                log_prefix, user_id, chat_id
+            )
+            await self.send(chat_id, text)
+            return STATUS_SENT, None
+
+        except TelegramForbiddenError as exc:
+            logger.warning("%s: user blocked bot user_id=%s", log_prefix, user_id)
+            return STATUS_BLOCKED, str(exc)
+
+        except TelegramRetryAfter as exc:
+            logger.warning(
+                "%s: flood wait retries exhausted user_id=%s retry_after=%s",
+                log_prefix, user_id, exc.retry_after
+            )
+            return STATUS_FAILED, str(exc)
+
+        except TelegramNetworkError as exc:
+            logger.warning(
+                "%s: network error user_id=%s err=%s",
+                log_prefix, user_id, exc
+            )
+            return STATUS_FAILED, str(exc)
+
+        except Exception as exc:
+            logger.exception("%s: unexpected error user_id=%s", log_prefix, user_id)
+            return STATUS_FAILED, repr(exc)
+
+    async def broadcast(
+        self,
+        recipients,
+        text: str,
+        log_prefix: str = "broadcast",
+        on_result=None,
+    ) -> BroadcastResult:
+        """
+        recipients: (user_id, chat_id) или (user_id, chat_id, text) для
+        персонального текста вместо общего text; обычный или async итератор
+        (см. app.recipients), отправка начинается с первой страницы.
+        on_result(user_id, status, error) вызывается после каждой попытки,
+        например DeliveryLedger.record.
+        """
+        result = BroadcastResult()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        shared = self.prepare(text)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                try:
+                    if item is None:
+                        return
+                    user_id, chat_id, *custom = item
+                    item_text = custom[0] if custom else shared
+                    status, error = await self._deliver(user_id, chat_id, item_text, log_prefix)
+                    result.add(status)
+                    if on_result is not None:
+                        await on_result(user_id, status, error)
+                finally:
+                    queue.task_done()
+
+        async def producer():
+            if hasattr(recipients, "__aiter__"):
+                async for recipient in recipients:
+                    await queue.put(recipient)
+            else:
+                for recipient in recipients:
+                    await queue.put(recipient)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        # если воркер упал (например, на записи в ledger), gather отменит остальных
+        tasks = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        tasks.append(asyncio.create_task(producer()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        logger.info(
+            "%s: delivered=%s blocked=%s failed=%s",
+            log_prefix, result.delivered, result.blocked, result.failed
+        )
+        return result
+
+
+async def broadcast_text(
+    bot,
+    recipients,
+    text: str,
+    log_prefix: str = "broadcast",
+    on_result=None,
+) -> BroadcastResult:
+    return await Broadcaster(bot).broadcast(
+        recipients, text, log_prefix=log_prefix, on_result=on_result
+    )
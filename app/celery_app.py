@@ -4,8 +4,6 @@ from celery.schedules import crontab
 from app.config import (
     REDIS_URL,
     TIMEZONE,
-    SEND_HOUR,
-    SEND_MINUTE,
     REMINDER_HOUR,
     REMINDER_MINUTE,
     ENABLE_SCHEDULES,
@@ -30,9 +28,10 @@ celery_app.conf.broker_transport_options = {
 celery_app.conf.beat_schedule = {}
 if ENABLE_SCHEDULES:
     celery_app.conf.beat_schedule = {
-        "send-daily": {
-            "task": "app.tasks.send_daily_task",
-            "schedule": crontab(hour=SEND_HOUR, minute=SEND_MINUTE),
+        # ежедневные сообщения и минуты получателей — одна очередь send_at
+        "send-outbox": {
+            "task": "app.tasks.send_outbox_task",
+            "schedule": crontab(),
         },
         "send-reminders": {
             "task": "app.tasks.send_reminders_task",
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, or_
+
+from app.config import CLAIM_LEASE_SECONDS
+from app.models import ScheduleMessage
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id() -> str:
+    # pid берем при каждом вызове: после fork (Celery prefork) он другой
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claimable(now: datetime):
+    return or_(
+        ScheduleMessage.claimed_until.is_(None),
+        ScheduleMessage.claimed_until < now,
+    )
+
+
+async def claim_messages(session_factory, query, lease_seconds: int = CLAIM_LEASE_SECONDS):
+    """
+    Атомарно забирает ScheduleMessage из query (select(ScheduleMessage)...)
+    под аренду: SELECT ... FOR UPDATE SKIP LOCKED + UPDATE claimed_by/claimed_until.
+    Транзакция короткая, дальше строки защищает только аренда, поэтому
+    второй воркер их не возьмет, пока claimed_until не истечет.
+    """
+    now = datetime.utcnow()
+    ids = (
+        query.with_only_columns(ScheduleMessage.id)
+        .where(claimable(now))
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(ScheduleMessage)
+        .where(ScheduleMessage.id.in_(ids))
+        .values(
+            claimed_by=worker_id(),
+            claimed_until=now + timedelta(seconds=lease_seconds),
+        )
+        .returning(ScheduleMessage)
+        .execution_options(synchronize_session=False)
+    )
+    async with session_factory() as session:
+        messages = (await session.scalars(stmt)).all()
+        await session.commit()
+    return sorted(messages, key=lambda m: (m.send_at or datetime.min, m.id))
+
+
+async def release_message(session_factory, msg_id: int, owner: str | None = None, **values) -> bool:
+    """
+    Снимает аренду и записывает итог. Если аренду уже перехватил другой
+    воркер (истекла), ничего не меняет и возвращает False.
+    owner — владелец аренды, если релиз делает другой процесс (chord callback).
+    """
+    async with session_factory() as session:
+        result = await session.execute(
+            update(ScheduleMessage)
+            .where(ScheduleMessage.id == msg_id)
+            .where(ScheduleMessage.claimed_by == (owner or worker_id()))
+            .values(claimed_by=None, claimed_until=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    if result.rowcount == 0:
+        logger.warning("claims: lease lost for schedule_id=%s", msg_id)
+        return False
+    return True
+
+
+async def renew_leases(
+    session_factory,
+    msg_ids,
+    lease_seconds: int = CLAIM_LEASE_SECONDS,
+    owner: str | None = None,
+):
+    async with session_factory() as session:
+        await session.execute(
+            update(ScheduleMessage)
+            .where(ScheduleMessage.id.in_(msg_ids))
+            .where(ScheduleMessage.claimed_by == (owner or worker_id()))
+            .values(claimed_until=datetime.utcnow() + timedelta(seconds=lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+
+@asynccontextmanager
+async def lease_heartbeat(
+    session_factory,
+    msg_ids,
+    lease_seconds: int = CLAIM_LEASE_SECONDS,
+    owner: str | None = None,
+):
+    """
+    Продлевает аренду каждые lease_seconds / 3, пока идет длинная рассылка.
+    """
+    async def beat():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            try:
+                await renew_leases(session_factory, msg_ids, lease_seconds, owner)
+            except Exception:
+                logger.exception("claims: lease renewal failed ids=%s", msg_ids)
+
+    task = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        task.cancel()
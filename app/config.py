@@ -16,3 +16,48 @@ REMINDER_SNOOZE_DEFAULT_DAYS = int(os.getenv("REMINDER_SNOOZE_DEFAULT_DAYS", "7"
 REMINDER_COOLDOWN_HOURS = int(os.getenv("REMINDER_COOLDOWN_HOURS", "24"))
 REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", "10"))
 REMINDER_MINUTE = int(os.getenv("REMINDER_MINUTE", "0"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "30"))
+# BROADCAST_GLOBAL_RATE на токен бота для всех процессов через Redis
+# (Celery -c N, чанки chord); без Celery — только лимит процесса
+BROADCAST_SHARED_LIMIT = os.getenv("BROADCAST_SHARED_LIMIT", "1" if USE_CELERY else "0") == "1"
+BROADCAST_PER_CHAT_RATE = float(os.getenv("BROADCAST_PER_CHAT_RATE", "1"))
+BROADCAST_MIN_RATE = float(os.getenv("BROADCAST_MIN_RATE", "1"))
+BROADCAST_RATE_RECOVERY = float(os.getenv("BROADCAST_RATE_RECOVERY", "0.5"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))
+RECIPIENT_PAGE_SIZE = int(os.getenv("RECIPIENT_PAGE_SIZE", "1000"))
+OUTBOX_MAX_IDLE_SECONDS = float(os.getenv("OUTBOX_MAX_IDLE_SECONDS", "300"))
+CLAIM_LEASE_SECONDS = int(os.getenv("CLAIM_LEASE_SECONDS", "600"))
+BROADCAST_FANOUT = os.getenv("BROADCAST_FANOUT", "0") == "1"
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "5000"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_PUBSUB = os.getenv("USER_CACHE_PUBSUB", "0") == "1"
+RULES_CACHE_TTL_SECONDS = float(os.getenv("RULES_CACHE_TTL_SECONDS", "300"))
+INBOX_FLUSH_MS = int(os.getenv("INBOX_FLUSH_MS", "200"))
+INBOX_FLUSH_ROWS = int(os.getenv("INBOX_FLUSH_ROWS", "500"))
+INBOX_MAX_PENDING = int(os.getenv("INBOX_MAX_PENDING", "50000"))
+# off | compact | full | zlib
+RAW_PAYLOAD_MODE = os.getenv("RAW_PAYLOAD_MODE", "zlib")
+# polling | webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "50"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# 0 — без lanes, стандартная обработка aiogram
+UPDATE_LANES = int(os.getenv("UPDATE_LANES", "16"))
+UPDATE_LANE_QUEUE = int(os.getenv("UPDATE_LANE_QUEUE", "100"))
+# memory | redis
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_STATE_TTL_SECONDS = int(os.getenv("FSM_STATE_TTL_SECONDS", "3600"))
+ADMIN_STATUS_PAGE_SIZE = int(os.getenv("ADMIN_STATUS_PAGE_SIZE", "10"))
+PROOFS_PAGE_SIZE = int(os.getenv("PROOFS_PAGE_SIZE", "10"))
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))
+# получателей на минуту рассылки; 0 — BROADCAST_GLOBAL_RATE * 60
+SEND_BUCKET_SIZE = int(os.getenv("SEND_BUCKET_SIZE", "0")) or int(BROADCAST_GLOBAL_RATE * 60)
+# общий текст рассылки сериализуется один раз, на запрос меняется только chat_id
+BROADCAST_PREPARED = os.getenv("BROADCAST_PREPARED", "1") == "1"
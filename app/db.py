@@ -1,3 +1,4 @@
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from app.config import DATABASE_URL
@@ -12,6 +13,12 @@ ENGINE_KWARGS = {
 def make_engine():
     return create_async_engine(DATABASE_URL, **ENGINE_KWARGS)
 
+
+def listen_dsn() -> str:
+    # DSN для голого asyncpg (LISTEN): без драйвера в схеме SQLAlchemy
+    url = make_url(DATABASE_URL).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
 engine = make_engine()
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
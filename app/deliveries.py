@@ -0,0 +1,292 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from sqlalchemy import select, func, literal, bindparam, update, delete, or_, and_, DateTime
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.broadcast import STATUS_PENDING, STATUS_SENT, STATUS_FAILED, broadcast_text
+from app.models import MessageDelivery, User
+from app.recipients import iter_keyset
+from app.send_plan import bucketed_due_sql
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_FLUSH_SIZE = 500
+# итоги пишутся не реже раза в секунду: после падения воркера повторно
+# уйдут только отправки последней секунды
+DELIVERY_FLUSH_SECONDS = 1.0
+# failed-получатель повторяется на следующих проходах, пока попыток меньше
+DELIVERY_MAX_ATTEMPTS = 3
+
+deliveries = MessageDelivery.__table__
+
+_update_delivery = (
+    update(deliveries)
+    .where(deliveries.c.schedule_message_id == bindparam("b_msg_id"))
+    .where(deliveries.c.user_id == bindparam("b_user_id"))
+    .values(
+        status=bindparam("b_status"),
+        error=bindparam("b_error"),
+        attempts=deliveries.c.attempts + 1,
+        updated_at=bindparam("b_updated_at"),
+    )
+)
+
+
+class DeliveryLedger:
+    """
+    Журнал доставки одного ScheduleMessage по получателям.
+    Повторный запуск рассылки отправляет только тем, кому еще не доставлено.
+    Получатели с due_at позже now ждут своей минуты (next_due).
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        schedule_message_id: int,
+        flush_size: int = DELIVERY_FLUSH_SIZE,
+        now: datetime | None = None,
+        flush_seconds: float = DELIVERY_FLUSH_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.schedule_message_id = schedule_message_id
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.now = now or datetime.utcnow()
+        self._buffer = []
+        self._timer = None
+        self._lock = asyncio.Lock()
+
+    async def prepare(self, audience, send_date=None):
+        """
+        Одним INSERT ... SELECT заводит pending-строки для всех user_id из
+        audience (select(User.id)...). Уже существующие строки не трогает.
+        С send_date каждому ставится due_at — его минута в этот день
+        (bucketed_due_sql), без нее все получатели due сразу.
+        """
+        due_at = bucketed_due_sql(send_date) if send_date is not None else literal(None, DateTime)
+        async with self.session_factory() as session:
+            stmt = pg_insert(MessageDelivery).from_select(
+                ["schedule_message_id", "user_id", "status", "attempts", "due_at"],
+                audience.with_only_columns(
+                    literal(self.schedule_message_id),
+                    User.id,
+                    literal(STATUS_PENDING),
+                    literal(0),
+                    due_at,
+                ),
+            ).on_conflict_do_nothing()
+            await session.execute(stmt)
+            await session.commit()
+
+    async def is_prepared(self) -> bool:
+        async with self.session_factory() as session:
+            return await session.scalar(
+                select(MessageDelivery.user_id)
+                .where(MessageDelivery.schedule_message_id == self.schedule_message_id)
+                .limit(1)
+            ) is not None
+
+    async def prepare_once(self, audience, send_date=None) -> bool:
+        """
+        prepare только при первом захвате сообщения: INSERT ... SELECT с
+        row_number() по всей аудитории не повторяется на каждой минуте
+        рассылки, дальше читаются только due-строки журнала. Получатели,
+        давшие consent после первого захвата, ждут следующего сообщения.
+        """
+        if await self.is_prepared():
+            return False
+        await self.prepare(audience, send_date)
+        return True
+
+    def due(self):
+        return or_(MessageDelivery.due_at.is_(None), MessageDelivery.due_at <= self.now)
+
+    def unsent(self):
+        """
+        Кому еще слать: pending и failed с попытками меньше
+        DELIVERY_MAX_ATTEMPTS. Без лимита failed-строки (chat not found,
+        бот исключен) повторялись бы на каждой минуте рассылки.
+        """
+        return or_(
+            MessageDelivery.status == STATUS_PENDING,
+            and_(
+                MessageDelivery.status == STATUS_FAILED,
+                MessageDelivery.attempts < DELIVERY_MAX_ATTEMPTS,
+            ),
+        )
+
+    def pending_query(self, lo: int | None = None, hi: int | None = None):
+        query = (
+            select(User.id, User.tg_chat_id)
+            .join(MessageDelivery, MessageDelivery.user_id == User.id)
+            .where(MessageDelivery.schedule_message_id == self.schedule_message_id)
+            .where(self.unsent())
+            .where(self.due())
+            # минуты получателей растянуты на день: отозвавшим consent не шлем
+            .where(User.consent.is_(True))
+        )
+        if lo is not None:
+            query = query.where(User.id >= lo)
+        if hi is not None:
+            query = query.where(User.id < hi)
+        return query
+
+    async def has_pending(self) -> bool:
+        async with self.session_factory() as session:
+            return await session.scalar(self.pending_query().limit(1)) is not None
+
+    async def pending_recipients(self, lo: int | None = None, hi: int | None = None):
+        async for row in iter_keyset(self.session_factory, self.pending_query(lo, hi), User.id):
+            yield row[0], row[1]
+
+    async def chunk_bounds(self, chunk_size: int):
+        """
+        Делит оставшихся получателей на диапазоны user_id [lo, hi) примерно
+        по chunk_size строк; hi = None у последнего. Один запрос.
+        """
+        numbered = (
+            select(
+                MessageDelivery.user_id,
+                func.row_number().over(order_by=MessageDelivery.user_id).label("rn"),
+            )
+            .where(MessageDelivery.schedule_message_id == self.schedule_message_id)
+            .where(self.unsent())
+            .where(self.due())
+            .subquery()
+        )
+        async with self.session_factory() as session:
+            starts = (await session.scalars(
+                select(numbered.c.user_id)
+                .where((numbered.c.rn - 1) % chunk_size == 0)
+                .order_by(numbered.c.user_id)
+            )).all()
+        return [
+            (lo, starts[i + 1] if i + 1 < len(starts) else None)
+            for i, lo in enumerate(starts)
+        ]
+
+    async def record(self, user_id: int, status: str, error: str | None = None):
+        self._buffer.append({
+            "b_msg_id": self.schedule_message_id,
+            "b_user_id": user_id,
+            "b_status": status,
+            "b_error": error,
+            "b_updated_at": datetime.utcnow(),
+        })
+        if len(self._buffer) >= self.flush_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_seconds)
+        # дальше таймер не отменяется: flush() дождется его записи на _lock
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception(
+                "delivery ledger: timed flush failed schedule_id=%s",
+                self.schedule_message_id
+            )
+
+    async def flush(self):
+        timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(_update_delivery, batch)
+                    await session.commit()
+            except Exception:
+                # не теряем итоги: их запишет следующий flush
+                self._buffer = batch + self._buffer
+                raise
+        logger.debug(
+            "delivery ledger: flushed %s rows schedule_id=%s",
+            len(batch), self.schedule_message_id
+        )
+
+    async def next_due(self) -> datetime | None:
+        """
+        Ближайшая минута, на которую еще остались получатели (после now).
+        """
+        async with self.session_factory() as session:
+            return await session.scalar(
+                select(func.min(MessageDelivery.due_at))
+                .join(User, User.id == MessageDelivery.user_id)
+                .where(MessageDelivery.schedule_message_id == self.schedule_message_id)
+                .where(User.consent.is_(True))
+                .where(MessageDelivery.status == STATUS_PENDING)
+                .where(MessageDelivery.due_at > self.now)
+            )
+
+    async def send_all_now(self, audience):
+        """
+        Ручная отправка: всем оставшимся получателям due_at = NULL.
+        """
+        await self.prepare(audience)
+        async with self.session_factory() as session:
+            await session.execute(
+                update(deliveries)
+                .where(deliveries.c.schedule_message_id == self.schedule_message_id)
+                .where(deliveries.c.status == STATUS_PENDING)
+                .where(deliveries.c.due_at.is_not(None))
+                .values(due_at=None)
+            )
+            await session.commit()
+
+    async def delivered_count(self) -> int:
+        async with self.session_factory() as session:
+            return await session.scalar(
+                select(func.count())
+                .select_from(MessageDelivery)
+                .where(MessageDelivery.schedule_message_id == self.schedule_message_id)
+                .where(MessageDelivery.status == STATUS_SENT)
+            )
+
+
+async def reset_deliveries(session, schedule_message_id: int):
+    await session.execute(
+        delete(MessageDelivery)
+        .where(MessageDelivery.schedule_message_id == schedule_message_id)
+    )
+
+
+async def deliver_schedule_message(
+    bot,
+    session_factory,
+    msg_id: int,
+    text: str,
+    audience,
+    log_prefix: str,
+    send_date=None,
+) -> int:
+    """
+    Рассылает ScheduleMessage через журнал доставки: при повторе после сбоя
+    сообщение уходит только оставшимся получателям. С send_date — только
+    тем, чья минута уже наступила.
+    Возвращает общее число доставленных (включая прошлые попытки).
+    """
+    ledger = DeliveryLedger(session_factory, msg_id)
+    await ledger.prepare_once(audience, send_date)
+    if await ledger.has_pending():
+        try:
+            await broadcast_text(
+                bot,
+                ledger.pending_recipients(),
+                text,
+                log_prefix=log_prefix,
+                on_result=ledger.record,
+            )
+        finally:
+            await ledger.flush()
+    else:
+        logger.info("%s: nothing pending", log_prefix)
+    return await ledger.delivered_count()
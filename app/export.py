@@ -0,0 +1,117 @@
+import asyncio
+import csv
+import gzip
+import os
+import tempfile
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import select
+
+from app.config import EXPORT_FETCH_SIZE
+from app.models import ScheduleMessage, InboxMessage, ActionEvent, ActionRule, MessageDelivery
+
+Export = namedtuple("Export", ["filename", "query"])
+
+EXPORTS = {
+    "schedule": Export(
+        "schedule_messages",
+        select(
+            ScheduleMessage.day_index,
+            ScheduleMessage.send_date,
+            ScheduleMessage.type,
+            ScheduleMessage.text,
+        ).order_by(ScheduleMessage.day_index),
+    ),
+    "inbox": Export(
+        "inbox_messages",
+        select(
+            InboxMessage.id,
+            InboxMessage.user_id,
+            InboxMessage.created_at,
+            InboxMessage.tg_message_id,
+            InboxMessage.media_type,
+            InboxMessage.media_file_id,
+            InboxMessage.action_status,
+            InboxMessage.action_rule_id,
+            InboxMessage.text,
+        ).order_by(InboxMessage.id),
+    ),
+    "actions": Export(
+        "action_events",
+        select(
+            ActionEvent.id,
+            ActionEvent.user_id,
+            ActionEvent.created_at,
+            ActionRule.title.label("rule"),
+            ActionEvent.old_expires_at,
+            ActionEvent.new_expires_at,
+            ActionEvent.raw_text,
+        )
+        .outerjoin(ActionRule, ActionRule.id == ActionEvent.rule_id)
+        .order_by(ActionEvent.id),
+    ),
+    "deliveries": Export(
+        "message_deliveries",
+        select(
+            MessageDelivery.schedule_message_id,
+            MessageDelivery.user_id,
+            MessageDelivery.status,
+            MessageDelivery.attempts,
+            MessageDelivery.due_at,
+            MessageDelivery.updated_at,
+            MessageDelivery.error,
+        ).order_by(MessageDelivery.schedule_message_id, MessageDelivery.user_id),
+    ),
+}
+
+
+def format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+async def export_csv(
+    session_factory,
+    name: str,
+    compress: bool = False,
+    fetch_size: int = EXPORT_FETCH_SIZE,
+):
+    """
+    Пишет выгрузку EXPORTS[name] во временный CSV (или .csv.gz) и возвращает
+    (путь, имя файла, число строк). Строки идут через серверный курсор
+    порциями по fetch_size, поэтому память не зависит от размера таблицы.
+    Временный файл удаляет вызывающий.
+    """
+    export = EXPORTS[name]
+    filename = f"{export.filename}.csv" + (".gz" if compress else "")
+    fd, path = tempfile.mkstemp(prefix=f"{name}_", suffix=".csv.gz" if compress else ".csv")
+    os.close(fd)
+
+    rows = 0
+    try:
+        opener = gzip.open if compress else open
+        with opener(path, "wt", encoding="utf-8", newline="") as out:
+            writer = csv.writer(out)
+
+            def write(partition):
+                writer.writerows([format_value(v) for v in row] for row in partition)
+
+            async with session_factory() as session:
+                result = await session.stream(
+                    export.query.execution_options(yield_per=fetch_size)
+                )
+                writer.writerow(result.keys())
+                async for partition in result.partitions():
+                    # форматирование и gzip — в потоке, event loop бота не блокируется
+                    await asyncio.to_thread(write, partition)
+                    rows += len(partition)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, filename, rows
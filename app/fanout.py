@@ -0,0 +1,122 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app.broadcast import broadcast_text
+from app.claims import claim_messages, renew_leases, lease_heartbeat, worker_id
+from app.config import BROADCAST_CHUNK_SIZE
+from app.deliveries import DeliveryLedger
+from app.models import ScheduleMessage
+from app.recipients import has_recipients, consenting_user_ids
+from app.scheduler import (
+    due_outbox_query,
+    skip_stale_messages,
+    finish_outbox,
+    postpone_no_users,
+)
+
+logger = logging.getLogger(__name__)
+
+KIND_OUTBOX = "outbox"
+
+
+async def plan_message(session_factory, msg, kind: str, now_utc: datetime, chunk_size: int) -> dict:
+    """
+    Заводит журнал доставки и делит получателей, чья минута уже наступила,
+    на диапазоны user_id. Результат сериализуется в аргументы Celery-задач.
+    """
+    ledger = DeliveryLedger(session_factory, msg.id, now=now_utc)
+    await ledger.prepare_once(consenting_user_ids(), msg.send_date)
+    bounds = await ledger.chunk_bounds(chunk_size)
+    logger.info(
+        "fanout: schedule_id=%s kind=%s chunks=%s",
+        msg.id, kind, len(bounds)
+    )
+    return {
+        "msg_id": msg.id,
+        "kind": kind,
+        "owner": worker_id(),
+        "now": now_utc.isoformat(),
+        "bounds": bounds,
+    }
+
+
+async def plan_daily(session_factory, chunk_size: int = BROADCAST_CHUNK_SIZE):
+    # как send_daily по расписанию: ежедневное сообщение — часть общей очереди
+    return await plan_outbox(session_factory, chunk_size=chunk_size)
+
+
+async def plan_outbox(
+    session_factory,
+    batch_size: int = 20,
+    retry_delay_seconds: int = 60,
+    chunk_size: int = BROADCAST_CHUNK_SIZE,
+):
+    now_utc = datetime.utcnow()
+
+    await skip_stale_messages(session_factory, now_utc)
+    messages = await claim_messages(session_factory, due_outbox_query(now_utc, batch_size))
+    if not messages:
+        logger.debug("fanout: no outbox messages")
+        return []
+
+    async with session_factory() as session:
+        has_users = await has_recipients(session)
+    if not has_users:
+        await postpone_no_users(session_factory, messages, now_utc, retry_delay_seconds)
+        return []
+
+    return [
+        await plan_message(session_factory, msg, KIND_OUTBOX, now_utc, chunk_size)
+        for msg in messages
+    ]
+
+
+async def send_chunk(bot, session_factory, msg_id: int, lo: int, hi: int | None, owner: str) -> dict:
+    """
+    Отправка одному диапазону user_id [lo, hi) по журналу доставки.
+    """
+    await renew_leases(session_factory, [msg_id], owner=owner)
+    async with session_factory() as session:
+        text = await session.scalar(
+            select(ScheduleMessage.text).where(ScheduleMessage.id == msg_id)
+        )
+
+    ledger = DeliveryLedger(session_factory, msg_id)
+    async with lease_heartbeat(session_factory, [msg_id], owner=owner):
+        try:
+            result = await broadcast_text(
+                bot,
+                ledger.pending_recipients(lo, hi),
+                text,
+                log_prefix=f"send_chunk schedule_id={msg_id} users=[{lo},{hi})",
+                on_result=ledger.record,
+            )
+        finally:
+            await ledger.flush()
+
+    return {
+        "delivered": result.delivered,
+        "blocked": result.blocked,
+        "failed": result.failed,
+    }
+
+
+async def finish_broadcast(session_factory, results, msg_id: int, kind: str, owner: str, now: str):
+    """
+    Callback chord: суммирует итоги чанков и снимает аренду сообщения.
+    """
+    totals = {"delivered": 0, "blocked": 0, "failed": 0}
+    for chunk in results or []:
+        for key in totals:
+            totals[key] += (chunk or {}).get(key, 0)
+
+    delivered = await DeliveryLedger(session_factory, msg_id).delivered_count()
+    logger.info(
+        "fanout: schedule_id=%s chunks=%s delivered=%s blocked=%s failed=%s total_delivered=%s",
+        msg_id, len(results or []), totals["delivered"], totals["blocked"], totals["failed"], delivered
+    )
+
+    await finish_outbox(session_factory, msg_id, delivered, datetime.fromisoformat(now), owner=owner)
+    return totals
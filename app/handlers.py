@@ -1,5 +1,4 @@
-import csv
-import io
+import os
 from datetime import datetime, timedelta
 from aiogram import Router, F
 from aiogram.types import (
@@ -7,12 +6,23 @@ from aiogram.types import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     CallbackQuery,
-    BufferedInputFile,
+    FSInputFile,
 )
-from aiogram.exceptions import TelegramNetworkError
-from sqlalchemy import select, desc, func
-from pytz import timezone as pytz_timezone
+from sqlalchemy import select, func, update
+from pytz import utc, all_timezones_set
+from app.admin_state import AdminStates, admin_context
+from app.admin_view import load_admin_overview, render_user_status, recent_inbox_query, split_messages, cut_utf16, MESSAGE_MAX
+from app.broadcast import broadcast_text
 from app.db import AsyncSessionLocal
+from app.deliveries import reset_deliveries
+from app.export import EXPORTS, export_csv
+from app.outbox import notify_outbox_changed, wake_outbox
+from app.recipients import iter_recipients, has_recipients
+from app.inbox_writer import inbox_writer
+from app.raw_payload import raw_columns, decode_raw, describe_raw, load_raw
+from app.review_queue import send_review_page, decode_cursor, CAPTION_MAX
+from app.rules_cache import rules_cache, PROOF_HINT
+from app.user_cache import get_cached_user, invalidate_user
 from app.models import (
     User,
     InboxMessage,
@@ -32,26 +42,16 @@ from app.config import (
     REMINDER_HOUR,
     REMINDER_MINUTE,
     ENABLE_SCHEDULES,
+    ADMIN_STATUS_PAGE_SIZE,
 )
 from app.tasks import send_random_task
 from app.scheduler import send_daily
+from app.send_plan import LOCAL_TZ, local_tomorrow, planned_send_at, replan_schedule
 
 router = Router()
-ADMIN_PENDING_TOMORROW = set()
-ADMIN_PENDING_COMPLIMENT = set()
 COMPLIMENT_PAGE_SIZE = 10
 COMPLIMENT_BUTTON_MAX = 48
 
-TASKS = [
-    "10 минут прогулки",
-    "3 благодарности в дневнике",
-    "15 минут растяжки",
-    "30 минут без соцсетей",
-    "сделала приятный сюрприз",
-]
-
-PROOF_HINT = "Нужны фото/кружок/видео."
-
 def admin_menu_keyboard():
     return InlineKeyboardMarkup(
         inline_keyboard=[
@@ -78,25 +78,39 @@ def user_menu_inline_keyboard():
         ]
     )
 
-def action_rules_keyboard(rules, inbox_id: int, prefix: str, include_deny: bool = False):
-    rows = []
-    for rule in rules:
-        label = f"{rule.title} (+{rule.days_to_extend} дн.)"
-        if prefix == "action_admin":
-            callback_data = f"{prefix}:approve:{rule.id}:{inbox_id}"
-        else:
-            callback_data = f"{prefix}:{rule.id}:{inbox_id}"
-        rows.append([InlineKeyboardButton(text=label, callback_data=callback_data)])
-    if include_deny:
-        rows.append([InlineKeyboardButton(text="Отклонить", callback_data=f"{prefix}:deny:{inbox_id}")])
-    return InlineKeyboardMarkup(inline_keyboard=rows)
-
 async def clear_inline_keyboard(message: Message):
     try:
         await message.edit_reply_markup(reply_markup=None)
     except Exception:
         return
 
+async def drop_inbox_buttons(message: Message, inbox_id: int):
+    """
+    Убирает кнопки одного доказательства; в очереди проверки на сообщении
+    остаются кнопки остальных.
+    """
+    markup = message.reply_markup
+    suffix = f":{inbox_id}"
+    rows = []
+    if markup:
+        for row in markup.inline_keyboard:
+            kept = [
+                button for button in row
+                if button.callback_data.startswith("proofs:") or not button.callback_data.endswith(suffix)
+            ]
+            if kept:
+                rows.append(kept)
+    if not any(
+        not button.callback_data.startswith("proofs:")
+        for row in rows for button in row
+    ):
+        await clear_inline_keyboard(message)
+        return
+    try:
+        await message.edit_reply_markup(reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
+    except Exception:
+        return
+
 def extract_text(message: Message) -> str:
     return message.text or message.caption or ""
 
@@ -143,13 +157,6 @@ def parse_send_selector(raw: str):
         return "day", value.strip()
     return "day", cleaned
 
-async def get_active_rules(session):
-    return (await session.scalars(
-        select(ActionRule)
-        .where(ActionRule.active.is_(True))
-        .order_by(ActionRule.id)
-    )).all()
-
 @router.message(F.text == "/start")
 async def start(message: Message):
     if message.from_user.id == ADMIN_TG_ID:
@@ -168,6 +175,7 @@ async def start(message: Message):
                 user.consent = True
                 user.tg_chat_id = message.chat.id
             await session.commit()
+        await invalidate_user(message.from_user.id)
         await message.answer(
             "Админ режим. Доступны команды: /status, /rules, /test_schedule, /proofs, /help, /admin",
             reply_markup=admin_menu_keyboard()
@@ -206,6 +214,7 @@ async def consent(message: Message):
                 )
                 session.add(sub)
         await session.commit()
+    await invalidate_user(message.from_user.id)
 
     if message.text.strip().lower() in ("да", "✅ да"):
         if sub and sub.expires_at:
@@ -233,27 +242,8 @@ async def consent(message: Message):
 
 @router.message(F.text == "/rules")
 async def rules(message: Message):
-    async with AsyncSessionLocal() as session:
-        rules_list = (await session.scalars(
-            select(ActionRule)
-            .where(ActionRule.active.is_(True))
-            .order_by(ActionRule.id)
-        )).all()
-
-    if not rules_list:
-        await message.answer("Правила пока не настроены.")
-        return
-
-    lines = ["Правила продления:"]
-    for rule in rules_list:
-        lines.append(f"- {rule.title}: +{rule.days_to_extend} дн.")
-    lines.append(PROOF_HINT)
-    lines.append("Как продлить: отправь фото/кружок/видео, админ подтвердит действие.")
-    lines.append("После отправки выбери действие из списка.")
-    lines.append("Задания:")
-    for task in TASKS:
-        lines.append(f"- {task}")
-    await message.answer("\n".join(lines))
+    snapshot = await rules_cache.get()
+    await message.answer(snapshot.text)
 
 @router.message(F.text == "/admin")
 async def admin_menu(message: Message):
@@ -276,6 +266,7 @@ async def help_command(message: Message):
             "/pick_compliment — выбрать и отправить комплимент вручную\n"
             "/schedule_status — показать текущие настройки расписания\n"
             "/schedule_all — все 365 сообщений\n"
+            "/export <schedule|inbox|actions|deliveries> [gz] — выгрузка CSV\n"
             "/outbox — сообщение на завтра\n"
             "/set_tomorrow — изменить сообщение на завтра\n"
             "/admin — меню админа\n"
@@ -289,6 +280,7 @@ async def help_command(message: Message):
             "- показывает правила: /rules\n"
             "- показывает статус подписки: /my_status\n"
             "- пауза напоминаний: /snooze 7, вернуть: /unsnooze\n"
+            "- время ежедневного сообщения: /timezone Europe/Berlin, /send_hour 9\n"
             "Как продлить: отправь фото/кружок/видео, админ подтвердит действие.\n"
             "Открыть меню: /menu"
         )
@@ -302,12 +294,10 @@ async def user_menu_command(message: Message):
 
 
 async def get_user_status_text(tg_user_id: int) -> str:
+    user = await get_cached_user(tg_user_id)
+    if not user:
+        return "Профиль еще не создан."
     async with AsyncSessionLocal() as session:
-        user = await session.scalar(
-            select(User).where(User.tg_user_id == tg_user_id)
-        )
-        if not user:
-            return "Профиль еще не создан."
         sub = await session.scalar(
             select(Subscription).where(Subscription.user_id == user.id)
         )
@@ -336,16 +326,17 @@ async def snooze(message: Message):
             await message.answer("Укажи число дней, например: /snooze 7")
             return
 
+    user = await get_cached_user(message.from_user.id)
+    if not user or not user.consent:
+        await message.answer("Сначала /start.")
+        return
+    snooze_until = datetime.utcnow() + timedelta(days=days)
     async with AsyncSessionLocal() as session:
-        user = await session.scalar(
-            select(User).where(User.tg_user_id == message.from_user.id)
+        await session.execute(
+            update(User).where(User.id == user.id).values(snooze_until=snooze_until)
         )
-        if not user or not user.consent:
-            await message.answer("Сначала /start.")
-            return
-        snooze_until = datetime.utcnow() + timedelta(days=days)
-        user.snooze_until = snooze_until
         await session.commit()
+    await invalidate_user(message.from_user.id)
 
     until_txt = snooze_until.strftime("%Y-%m-%d")
     await message.answer(f"Ок, напоминания на паузе до {until_txt}.")
@@ -353,18 +344,62 @@ async def snooze(message: Message):
 
 @router.message(F.text == "/unsnooze")
 async def unsnooze(message: Message):
+    user = await get_cached_user(message.from_user.id)
+    if not user or not user.consent:
+        await message.answer("Сначала /start.")
+        return
     async with AsyncSessionLocal() as session:
-        user = await session.scalar(
-            select(User).where(User.tg_user_id == message.from_user.id)
+        await session.execute(
+            update(User).where(User.id == user.id).values(snooze_until=None)
         )
-        if not user or not user.consent:
-            await message.answer("Сначала /start.")
-            return
-        user.snooze_until = None
         await session.commit()
+    await invalidate_user(message.from_user.id)
 
     await message.answer("Напоминания снова активны.")
 
+
+async def update_send_time(tg_user_id: int, **values) -> bool:
+    user = await get_cached_user(tg_user_id)
+    if not user or not user.consent:
+        return False
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(User).where(User.id == user.id).values(**values))
+        # ближайшие сообщения могут понадобиться раньше: пересчитать send_at
+        await replan_schedule(session, from_date=local_tomorrow())
+        await notify_outbox_changed(session)
+        await session.commit()
+    wake_outbox()
+    return True
+
+
+@router.message(F.text.startswith("/timezone"))
+async def set_timezone(message: Message):
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2 or parts[1].strip() not in all_timezones_set:
+        await message.answer(f"Укажи часовой пояс, например: /timezone Europe/Berlin (по умолчанию {TIMEZONE})")
+        return
+    tz_name = parts[1].strip()
+    if not await update_send_time(message.from_user.id, timezone=tz_name):
+        await message.answer("Сначала /start.")
+        return
+    await message.answer(f"Ок, сообщения будут приходить по времени {tz_name}.")
+
+
+@router.message(F.text.startswith("/send_hour"))
+async def set_send_hour(message: Message):
+    parts = (message.text or "").split(maxsplit=1)
+    try:
+        hour = int(parts[1])
+        if not 0 <= hour <= 23:
+            raise ValueError
+    except (IndexError, ValueError):
+        await message.answer(f"Укажи час от 0 до 23, например: /send_hour 9 (по умолчанию {SEND_HOUR})")
+        return
+    if not await update_send_time(message.from_user.id, send_hour=hour):
+        await message.answer("Сначала /start.")
+        return
+    await message.answer(f"Ок, ежедневное сообщение будет приходить в {hour:02d}:{SEND_MINUTE:02d}.")
+
 async def send_random_to_users(bot, chat_id: int):
     if USE_CELERY:
         send_random_task.delay()
@@ -379,13 +414,7 @@ async def send_random_to_users(bot, chat_id: int):
             await bot.send_message(chat_id, "В базе нет сообщений.")
             return
 
-        users = (await session.scalars(
-            select(User)
-            .where(User.consent.is_(True))
-            .where(User.tg_user_id != ADMIN_TG_ID)
-            .order_by(User.id)
-        )).all()
-        if not users:
+        if not await has_recipients(session, exclude_admin=True):
             await bot.send_message(chat_id, "Нет пользователей для отправки (нужен consent).")
             return
 
@@ -396,26 +425,13 @@ async def send_random_to_users(bot, chat_id: int):
     )
 
 async def send_text_to_users(bot, text: str):
-    async with AsyncSessionLocal() as session:
-        users = (await session.scalars(
-            select(User)
-            .where(User.consent.is_(True))
-            .where(User.tg_user_id != ADMIN_TG_ID)
-            .order_by(User.id)
-        )).all()
-    if not users:
-        return 0, 0
-
-    delivered = 0
-    for user in users:
-        try:
-            await bot.send_message(user.tg_chat_id, text)
-            delivered += 1
-        except TelegramNetworkError:
-            continue
-        except Exception:
-            continue
-    return delivered, len(users)
+    result = await broadcast_text(
+        bot,
+        iter_recipients(AsyncSessionLocal, exclude_admin=True),
+        text,
+        log_prefix="send_text_to_users",
+    )
+    return result.delivered, result.total
 
 async def send_compliment_by_selector(bot, selector_type, selector_num):
     async with AsyncSessionLocal() as session:
@@ -431,109 +447,77 @@ async def send_compliment_by_selector(bot, selector_type, selector_num):
         return None, None
     return await send_text_to_users(bot, msg.text)
 
-async def get_primary_user(session):
-    return await session.scalar(select(User).order_by(User.id))
+def admin_status_keyboard(last_id: int):
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="Дальше", callback_data=f"admin:status:{last_id}")]]
+    )
 
-async def send_admin_status(bot, chat_id: int):
+async def send_admin_status(bot, chat_id: int, after_id: int = 0):
     async with AsyncSessionLocal() as session:
-        user = await get_primary_user(session)
-        if not user:
-            await bot.send_message(chat_id, "Пользователя еще нет.")
-            return
-        sub = await session.scalar(
-            select(Subscription).where(Subscription.user_id == user.id)
+        views = await load_admin_overview(session, after_id)
+    if not views:
+        await bot.send_message(chat_id, "Больше пользователей нет." if after_id else "Пользователя еще нет.")
+        return
+    keyboard = admin_status_keyboard(views[-1].id) if len(views) == ADMIN_STATUS_PAGE_SIZE else None
+    # страница может не влезть в одно сообщение; кнопка «Дальше» — на последнем
+    chunks = split_messages(render_user_status(view) for view in views)
+    for i, chunk in enumerate(chunks):
+        await bot.send_message(
+            chat_id,
+            chunk,
+            reply_markup=keyboard if i == len(chunks) - 1 else None
         )
-    expires = sub.expires_at.strftime("%Y-%m-%d %H:%M") if sub and sub.expires_at else "нет"
-    await bot.send_message(chat_id, f"Подписка до: {expires}")
 
 async def send_admin_user(bot, chat_id: int):
     async with AsyncSessionLocal() as session:
-        user = await get_primary_user(session)
-    if not user:
+        views = await load_admin_overview(session)
+    if not views:
         await bot.send_message(chat_id, "Пользователя еще нет.")
         return
-    await bot.send_message(
-        chat_id,
-        f"User id: {user.id}\nTG user id: {user.tg_user_id}\nChat id: {user.tg_chat_id}\nConsent: {user.consent}"
-    )
+    for chunk in split_messages(
+        f"User id: {view.id}\nTG user id: {view.tg_user_id}\nChat id: {view.tg_chat_id}\nConsent: {view.consent}"
+        for view in views
+    ):
+        await bot.send_message(chat_id, chunk)
 
 async def send_admin_inbox(bot, chat_id: int):
     async with AsyncSessionLocal() as session:
-        user = await get_primary_user(session)
-        if not user:
-            await bot.send_message(chat_id, "Пользователя еще нет.")
-            return
-        messages = (await session.scalars(
-            select(InboxMessage)
-            .where(InboxMessage.user_id == user.id)
-            .order_by(InboxMessage.created_at.desc())
-            .limit(10)
-        )).all()
+        messages = (await session.execute(recent_inbox_query())).all()
     if not messages:
         await bot.send_message(chat_id, "Сообщений пока нет.")
         return
     for msg in messages:
+        details = describe_raw(decode_raw(msg.raw, msg.raw_payload))
+        sender = f"tg {msg.tg_user_id} ({details})" if details else f"tg {msg.tg_user_id}"
+        caption = f"{sender}: {msg.text or '[медиа]'}"
         if msg.media_type == "photo":
-            await bot.send_photo(chat_id, msg.media_file_id, caption=msg.text)
+            await bot.send_photo(chat_id, msg.media_file_id, caption=cut_utf16(caption, CAPTION_MAX))
         elif msg.media_type == "video":
-            await bot.send_video(chat_id, msg.media_file_id, caption=msg.text)
+            await bot.send_video(chat_id, msg.media_file_id, caption=cut_utf16(caption, CAPTION_MAX))
         elif msg.media_type == "video_note":
             await bot.send_video_note(chat_id, msg.media_file_id)
         else:
-            await bot.send_message(chat_id, msg.text or "[медиа]")
+            await bot.send_message(chat_id, cut_utf16(caption, MESSAGE_MAX))
 
-async def send_admin_proofs(bot, chat_id: int):
-    async with AsyncSessionLocal() as session:
-        user = await get_primary_user(session)
-        if not user:
-            await bot.send_message(chat_id, "Пользователя еще нет.")
+async def send_admin_proofs(bot, chat_id: int, cursor=None):
+    await send_review_page(bot, chat_id, AsyncSessionLocal, await rules_cache.get(), cursor)
+
+async def send_admin_export(bot, chat_id: int, name: str, compress: bool = False, empty_text: str = "Нет данных."):
+    path, filename, rows = await export_csv(AsyncSessionLocal, name, compress)
+    try:
+        if not rows:
+            await bot.send_message(chat_id, empty_text)
             return
-        proofs_list = (await session.scalars(
-            select(InboxMessage)
-            .where(InboxMessage.user_id == user.id)
-            .where(InboxMessage.media_file_id.isnot(None))
-            .order_by(InboxMessage.created_at.desc())
-            .limit(10)
-        )).all()
-    if not proofs_list:
-        await bot.send_message(chat_id, "Пока нет доказательств.")
-        return
-    for msg in proofs_list:
-        if msg.media_type == "photo":
-            await bot.send_photo(chat_id, msg.media_file_id, caption=msg.text)
-        elif msg.media_type == "video":
-            await bot.send_video(chat_id, msg.media_file_id, caption=msg.text)
-        elif msg.media_type == "video_note":
-            await bot.send_video_note(chat_id, msg.media_file_id)
-        else:
-            await bot.send_message(chat_id, msg.text or "[медиа]")
+        await bot.send_document(chat_id, FSInputFile(path, filename=filename))
+    finally:
+        os.unlink(path)
 
 async def send_admin_schedule(bot, chat_id: int):
-    async with AsyncSessionLocal() as session:
-        items = (await session.scalars(
-            select(ScheduleMessage)
-            .order_by(ScheduleMessage.day_index)
-        )).all()
-    if not items:
-        await bot.send_message(chat_id, "Сообщений в расписании нет.")
-        return
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["day_index", "send_date", "type", "text"])
-    for item in items:
-        writer.writerow([
-            item.day_index,
-            item.send_date.isoformat() if item.send_date else "",
-            item.type or "",
-            item.text or "",
-        ])
-    data = output.getvalue().encode("utf-8")
-    await bot.send_document(chat_id, BufferedInputFile(data, filename="schedule_messages.csv"))
+    await send_admin_export(bot, chat_id, "schedule", empty_text="Сообщений в расписании нет.")
 
 async def send_admin_next_message(bot, chat_id: int):
     async with AsyncSessionLocal() as session:
-        tomorrow = datetime.now().date() + timedelta(days=1)
+        tomorrow = local_tomorrow()
         msg = await session.scalar(
             select(ScheduleMessage)
             .where(ScheduleMessage.send_date == tomorrow)
@@ -550,7 +534,7 @@ async def send_admin_next_message(bot, chat_id: int):
 
 async def update_admin_tomorrow_message(text: str):
     async with AsyncSessionLocal() as session:
-        tomorrow = datetime.now().date() + timedelta(days=1)
+        tomorrow = local_tomorrow()
         msg = await session.scalar(
             select(ScheduleMessage)
             .where(ScheduleMessage.send_date == tomorrow)
@@ -558,8 +542,9 @@ async def update_admin_tomorrow_message(text: str):
         if msg:
             msg.text = text
             msg.type = msg.type or "manual"
+            await reset_deliveries(session, msg.id)
             msg.sent_at = None
-            msg.send_at = None
+            msg.send_at = planned_send_at(tomorrow)
             msg.attempts = 0
             msg.last_attempt_at = None
             msg.last_error = None
@@ -570,44 +555,23 @@ async def update_admin_tomorrow_message(text: str):
             session.add(ScheduleMessage(
                 day_index=(max_day_index or 0) + 1,
                 send_date=tomorrow,
+                send_at=planned_send_at(tomorrow),
                 type="manual",
                 text=text
             ))
+        await session.flush()
+        # раньше SEND_HOUR, если у кого-то из получателей свое время
+        await replan_schedule(session, from_date=tomorrow)
+        await notify_outbox_changed(session)
         await session.commit()
-        return tomorrow
+    wake_outbox()
+    return tomorrow
 
 @router.message(F.text == "/status")
 async def status(message: Message):
     if message.from_user.id != ADMIN_TG_ID:
         return
-
-    async with AsyncSessionLocal() as session:
-        user = await session.scalar(select(User))
-        if not user:
-            await message.answer("Пользователя еще нет.")
-            return
-
-        sub = await session.scalar(
-            select(Subscription).where(Subscription.user_id == user.id)
-        )
-        result = await session.execute(
-            select(ActionEvent, ActionRule)
-            .join(ActionRule, ActionRule.id == ActionEvent.rule_id)
-            .where(ActionEvent.user_id == user.id)
-            .order_by(desc(ActionEvent.created_at))
-            .limit(5)
-        )
-        events = result.all()
-
-    expires = sub.expires_at.isoformat(sep=" ", timespec="minutes") if sub and sub.expires_at else "нет"
-    lines = [f"Подписка до: {expires}"]
-    if events:
-        lines.append("Последние действия:")
-        for ev, rule in events:
-            when = ev.created_at.strftime("%Y-%m-%d %H:%M")
-            new_exp = ev.new_expires_at.strftime("%Y-%m-%d %H:%M") if ev.new_expires_at else "нет"
-            lines.append(f"- {when}: {rule.title} -> до {new_exp}")
-    await message.answer("\n".join(lines))
+    await send_admin_status(message.bot, message.chat.id)
 
 
 @router.message(F.text == "/proofs")
@@ -626,15 +590,16 @@ async def outbox(message: Message):
 async def set_tomorrow(message: Message):
     if message.from_user.id != ADMIN_TG_ID:
         return
-    ADMIN_PENDING_TOMORROW.add(message.from_user.id)
+    await admin_context(message.bot, message.from_user.id).set_state(AdminStates.tomorrow)
     await message.answer("Пришли новый текст для завтрашнего сообщения. Отмена: /cancel_tomorrow")
 
 @router.message(F.text == "/cancel_tomorrow")
 async def cancel_tomorrow(message: Message):
     if message.from_user.id != ADMIN_TG_ID:
         return
-    if message.from_user.id in ADMIN_PENDING_TOMORROW:
-        ADMIN_PENDING_TOMORROW.discard(message.from_user.id)
+    state = admin_context(message.bot, message.from_user.id)
+    if await state.get_state() == AdminStates.tomorrow.state:
+        await state.clear()
         await message.answer("Отменено.")
     else:
         await message.answer("Нет активного редактирования.")
@@ -643,8 +608,9 @@ async def cancel_tomorrow(message: Message):
 async def cancel_compliment(message: Message):
     if message.from_user.id != ADMIN_TG_ID:
         return
-    if message.from_user.id in ADMIN_PENDING_COMPLIMENT:
-        ADMIN_PENDING_COMPLIMENT.discard(message.from_user.id)
+    state = admin_context(message.bot, message.from_user.id)
+    if await state.get_state() == AdminStates.compliment.state:
+        await state.clear()
         await message.answer("Отменено.")
     else:
         await message.answer("Нет активного выбора комплимента.")
@@ -655,21 +621,32 @@ async def schedule_all(message: Message):
         return
     await send_admin_schedule(message.bot, message.chat.id)
 
+@router.message(F.text.startswith("/export"))
+async def export(message: Message):
+    if message.from_user.id != ADMIN_TG_ID:
+        return
+    parts = (message.text or "").split()
+    if len(parts) < 2 or parts[1] not in EXPORTS:
+        await message.answer(f"Выгрузки: {', '.join(EXPORTS)}. Пример: /export inbox gz")
+        return
+    compress = len(parts) > 2 and parts[2] == "gz"
+    await send_admin_export(message.bot, message.chat.id, parts[1], compress)
+
 @router.message(F.text == "/schedule_status")
 async def schedule_status(message: Message):
     if message.from_user.id != ADMIN_TG_ID:
         return
 
-    tz = pytz_timezone(TIMEZONE)
-    now_local = datetime.now(tz)
-    today_local = now_local.date()
+    now_local = datetime.now(LOCAL_TZ)
 
     async with AsyncSessionLocal() as session:
+        # голова очереди send_at: то же, что возьмет диспетчер
         next_msg = await session.scalar(
             select(ScheduleMessage)
-            .where(ScheduleMessage.send_date >= today_local)
             .where(ScheduleMessage.sent_at.is_(None))
-            .order_by(ScheduleMessage.send_date)
+            .where(ScheduleMessage.send_at.is_not(None))
+            .order_by(ScheduleMessage.send_at, ScheduleMessage.id)
+            .limit(1)
         )
 
     lines = [
@@ -678,8 +655,9 @@ async def schedule_status(message: Message):
         f"Напоминания: {REMINDER_HOUR:02d}:{REMINDER_MINUTE:02d} {TIMEZONE}",
         f"USE_CELERY={int(USE_CELERY)} ENABLE_SCHEDULES={int(ENABLE_SCHEDULES)}",
     ]
-    if next_msg and next_msg.send_date:
-        lines.append(f"Следующее сообщение: {next_msg.send_date.isoformat()}")
+    if next_msg:
+        next_local = utc.localize(next_msg.send_at).astimezone(LOCAL_TZ)
+        lines.append(f"Следующее сообщение: {next_local.strftime('%Y-%m-%d %H:%M')}")
     else:
         lines.append("Следующее сообщение: нет")
     await message.answer("\n".join(lines))
@@ -694,7 +672,7 @@ async def send_random(message: Message):
 async def send_daily_now(message: Message):
     if message.from_user.id != ADMIN_TG_ID:
         return
-    await send_daily(message.bot)
+    await send_daily(message.bot, send_now=True)
     await message.answer("Попытался отправить дневное сообщение.")
 
 @router.message(F.text.startswith("/send_compliment"))
@@ -741,12 +719,17 @@ async def pick_compliment(message: Message):
 
 @router.message()
 async def inbox(message: Message):
-    if message.from_user.id == ADMIN_TG_ID and message.from_user.id in ADMIN_PENDING_COMPLIMENT:
+    admin_state = None
+    if message.from_user.id == ADMIN_TG_ID:
+        state = admin_context(message.bot, message.from_user.id)
+        admin_state = await state.get_state()
+
+    if admin_state == AdminStates.compliment.state:
         text = extract_text(message).strip()
         if not text:
             await message.answer("Нужен номер дня или id. Отмена: /cancel_compliment")
             return
-        ADMIN_PENDING_COMPLIMENT.discard(message.from_user.id)
+        await state.clear()
         selector_type, selector_value = parse_send_selector(text)
         try:
             selector_num = int(selector_value)
@@ -760,50 +743,60 @@ async def inbox(message: Message):
         await message.answer(f"Отправлено: {delivered} из {total} пользователей.")
         return
 
-    if message.from_user.id == ADMIN_TG_ID and message.from_user.id in ADMIN_PENDING_TOMORROW:
+    if admin_state == AdminStates.tomorrow.state:
         text = extract_text(message).strip()
         if not text:
             await message.answer("Нужен текст. Отмена: /cancel_tomorrow")
             return
-        ADMIN_PENDING_TOMORROW.discard(message.from_user.id)
+        await state.clear()
         tomorrow = await update_admin_tomorrow_message(text)
         await message.answer(f"Обновил сообщение на завтра ({tomorrow}).")
         return
 
-    async with AsyncSessionLocal() as session:
-        user = await session.scalar(
-            select(User).where(User.tg_user_id == message.from_user.id)
-        )
-        if not user or not user.consent:
-            return
-
-        text = extract_text(message)
-        media_type, media_file_id = extract_media(message)
-        has_proof = has_proof_media(message)
-        now = datetime.utcnow()
-        inbox = InboxMessage(
-            user_id=user.id,
-            tg_message_id=message.message_id,
-            text=text,
-            media_type=media_type,
-            media_file_id=media_file_id,
-            action_status="pending" if has_proof else None,
-            raw=message.model_dump_json()
-        )
-        session.add(inbox)
-        user.last_activity_at = now
-
-        rules = []
-        if has_proof:
-            rules = await get_active_rules(session)
+    # горячий путь: пользователь и consent из кеша, без SELECT на каждое сообщение
+    user = await get_cached_user(message.from_user.id)
+    if not user or not user.consent:
+        return
 
-        await session.flush()
-        await session.commit()
+    text = extract_text(message)
+    media_type, media_file_id = extract_media(message)
+    has_proof = has_proof_media(message)
+    now = datetime.utcnow()
+    if has_proof:
+        # id нужен сразу для кнопок, поэтому доказательство пишем синхронно
+        async with AsyncSessionLocal() as session:
+            inbox = InboxMessage(
+                user_id=user.id,
+                tg_message_id=message.message_id,
+                text=text,
+                media_type=media_type,
+                media_file_id=media_file_id,
+                action_status="pending",
+                created_at=now,
+                **raw_columns(message),
+            )
+            session.add(inbox)
+            await session.execute(
+                update(User).where(User.id == user.id).values(last_activity_at=now)
+            )
+            await session.commit()
+    else:
+        inbox_writer.submit({
+            "user_id": user.id,
+            "tg_message_id": message.message_id,
+            "text": text,
+            "media_type": media_type,
+            "media_file_id": media_file_id,
+            "action_status": None,
+            "created_at": now,
+            **raw_columns(message),
+        })
 
     # уведомляем админа и даем кнопки выбора правила
     if has_proof:
+        rules = await rules_cache.get()
         caption = f"Доказательство:\n{text}\n\nВыбери действие или отклони.".strip()
-        admin_keyboard = action_rules_keyboard(rules, inbox.id, "action_admin", include_deny=True)
+        admin_keyboard = rules.keyboard(inbox.id, "action_admin", include_deny=True)
         if media_type == "photo":
             await message.bot.send_photo(
                 ADMIN_TG_ID,
@@ -830,10 +823,10 @@ async def inbox(message: Message):
                 caption,
                 reply_markup=admin_keyboard
             )
-        if rules:
+        if rules.rules:
             await message.answer(
                 "Спасибо! Выбери действие для этого доказательства:",
-                reply_markup=action_rules_keyboard(rules, inbox.id, "action_user")
+                reply_markup=rules.keyboard(inbox.id, "action_user")
             )
         else:
             await message.answer("Спасибо! Я передал доказательства на проверку.")
@@ -939,13 +932,13 @@ async def action_user_callback(callback: CallbackQuery):
             await clear_inline_keyboard(callback.message)
             return
 
-        user = await session.scalar(select(User).where(User.id == inbox.user_id))
-        if not user or user.tg_user_id != callback.from_user.id:
+        user = await get_cached_user(callback.from_user.id, session)
+        if not user or user.id != inbox.user_id:
             await callback.answer("Недоступно.")
             return
 
-        rule = await session.get(ActionRule, rule_id)
-        if not rule or not rule.active:
+        rule = (await rules_cache.get()).by_id.get(rule_id)
+        if not rule:
             await callback.answer("Правило недоступно.")
             return
 
@@ -991,7 +984,7 @@ async def action_admin_callback(callback: CallbackQuery):
         result = await apply_action_for_inbox(inbox_id, rule_id)
         if result[0] == "already":
             await callback.answer("Уже обработано.")
-            await clear_inline_keyboard(callback.message)
+            await drop_inbox_buttons(callback.message, inbox_id)
             return
 
         _, new_expires, user_chat_id, rule_title = result
@@ -999,7 +992,7 @@ async def action_admin_callback(callback: CallbackQuery):
             await callback.answer("Не удалось применить действие.")
             return
 
-        await clear_inline_keyboard(callback.message)
+        await drop_inbox_buttons(callback.message, inbox_id)
         await callback.answer("Продлено.")
         new_txt = new_expires.strftime("%Y-%m-%d %H:%M")
         await callback.message.answer(f"Подписка продлена до {new_txt}.")
@@ -1008,6 +1001,25 @@ async def action_admin_callback(callback: CallbackQuery):
                 user_chat_id,
                 f"Подписка продлена до {new_txt}. Спасибо за действие: {rule_title}!"
             )
+    elif action == "pick":
+        if len(parts) != 3:
+            await callback.answer("Ошибка данных.")
+            return
+        try:
+            inbox_id = int(parts[2])
+        except ValueError:
+            await callback.answer("Ошибка данных.")
+            return
+        # из очереди проверки: правил больше, чем влезает в ряд кнопок
+        rules = await rules_cache.get()
+        async with AsyncSessionLocal() as session:
+            details = describe_raw(await load_raw(session, inbox_id))
+        header = f"Доказательство #{inbox_id} ({details})" if details else f"Доказательство #{inbox_id}"
+        await callback.answer()
+        await callback.message.answer(
+            f"{header}: выбери действие или отклони.",
+            reply_markup=rules.keyboard(inbox_id, "action_admin", include_deny=True)
+        )
     elif action == "deny":
         if len(parts) != 3:
             await callback.answer("Ошибка данных.")
@@ -1022,10 +1034,10 @@ async def action_admin_callback(callback: CallbackQuery):
         user_chat_id, user_tg_id = await deny_action_for_inbox(inbox_id)
         if user_chat_id == "already":
             await callback.answer("Уже обработано.")
-            await clear_inline_keyboard(callback.message)
+            await drop_inbox_buttons(callback.message, inbox_id)
             return
 
-        await clear_inline_keyboard(callback.message)
+        await drop_inbox_buttons(callback.message, inbox_id)
         await callback.answer("Отклонено.")
         await callback.message.answer("Доказательство отклонено.")
         if user_chat_id:
@@ -1040,6 +1052,19 @@ async def action_admin_callback(callback: CallbackQuery):
 
 
 
+@router.callback_query(F.data.startswith("proofs:"))
+async def proofs_page_callback(callback: CallbackQuery):
+    if callback.from_user.id != ADMIN_TG_ID:
+        await callback.answer("Недоступно.")
+        return
+    cursor = decode_cursor(callback.data.split(":", 1)[1])
+    if cursor is None:
+        await callback.answer("Ошибка данных.")
+        return
+    await callback.answer()
+    await send_admin_proofs(callback.message.bot, callback.message.chat.id, cursor)
+
+
 @router.callback_query(F.data.startswith("admin:"))
 async def admin_menu_callback(callback: CallbackQuery):
     if callback.from_user.id != ADMIN_TG_ID:
@@ -1055,6 +1080,13 @@ async def admin_menu_callback(callback: CallbackQuery):
         await send_admin_status(callback.message.bot, callback.message.chat.id)
     elif action == "status":
         await send_admin_status(callback.message.bot, callback.message.chat.id)
+    elif action.startswith("status:"):
+        try:
+            after_id = int(action.split(":", 1)[1])
+        except ValueError:
+            await callback.answer("Ошибка данных.")
+            return
+        await send_admin_status(callback.message.bot, callback.message.chat.id, after_id)
     elif action == "user":
         await send_admin_user(callback.message.bot, callback.message.chat.id)
     elif action == "inbox":
@@ -1064,17 +1096,17 @@ async def admin_menu_callback(callback: CallbackQuery):
     elif action in ("next", "outbox"):
         await send_admin_next_message(callback.message.bot, callback.message.chat.id)
     elif action == "edit_next":
-        ADMIN_PENDING_TOMORROW.add(callback.from_user.id)
+        await admin_context(callback.message.bot, callback.from_user.id).set_state(AdminStates.tomorrow)
         await callback.message.answer("Пришли новый текст для завтрашнего сообщения. Отмена: /cancel_tomorrow")
     elif action == "schedule":
         await send_admin_schedule(callback.message.bot, callback.message.chat.id)
     elif action == "send_daily":
-        await send_daily(callback.message.bot)
+        await send_daily(callback.message.bot, send_now=True)
         await callback.message.answer("Попытался отправить дневное сообщение.")
     elif action == "schedule_status":
         await schedule_status(callback.message)
     elif action == "compliment_by_number":
-        ADMIN_PENDING_COMPLIMENT.add(callback.from_user.id)
+        await admin_context(callback.message.bot, callback.from_user.id).set_state(AdminStates.compliment)
         await callback.message.answer(
             "Пришли номер дня или id сообщения (например: 25 или id=123). Отмена: /cancel_compliment"
         )
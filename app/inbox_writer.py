@@ -0,0 +1,136 @@
+import asyncio
+import logging
+
+from sqlalchemy import insert, update, bindparam, func, DateTime
+from sqlalchemy.exc import DBAPIError
+
+from app.config import INBOX_FLUSH_MS, INBOX_FLUSH_ROWS, INBOX_MAX_PENDING
+from app.db import AsyncSessionLocal
+from app.models import InboxMessage, User
+
+logger = logging.getLogger(__name__)
+
+users = User.__table__
+
+# SQLSTATE-классы, где виновата сама строка, а не БД: 22 — ошибка данных,
+# 23 — нарушение ограничений, 54 — превышен лимит (размер строки)
+BAD_ROW_SQLSTATE_CLASSES = ("22", "23", "54")
+
+
+def is_bad_row(exc: Exception) -> bool:
+    sqlstate = getattr(getattr(exc, "orig", None), "sqlstate", None) or ""
+    return isinstance(exc, DBAPIError) and sqlstate[:2] in BAD_ROW_SQLSTATE_CLASSES
+
+# greatest: синхронный путь доказательств мог уже записать время новее
+_touch_user = (
+    update(users)
+    .where(users.c.id == bindparam("b_user_id"))
+    .values(last_activity_at=func.greatest(users.c.last_activity_at, bindparam("b_at", type_=DateTime)))
+)
+
+
+class InboxWriter:
+    """
+    Write-behind для обычных сообщений (не доказательств): строки копятся
+    в памяти и пишутся одной транзакцией раз в flush_ms или при
+    накоплении flush_rows — один multi-row INSERT и по одному UPDATE
+    last_activity_at на пользователя.
+    Доказательствам нужен id сразу, они идут мимо, синхронно.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        flush_ms: int = INBOX_FLUSH_MS,
+        flush_rows: int = INBOX_FLUSH_ROWS,
+        max_pending: int = INBOX_MAX_PENDING,
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_ms / 1000
+        self.flush_rows = flush_rows
+        self.max_pending = max_pending
+        self._rows = []
+        self._wake = asyncio.Event()
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    def submit(self, row: dict):
+        """
+        row — значения колонок InboxMessage, включая user_id и created_at.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_rows:
+            self._wake.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        """
+        Пишет очередь пачками по flush_rows. Если пачка упала на ошибке
+        данных (битая строка, пользователь удален), пачка делится пополам,
+        пока не найдется сама строка: она отбрасывается, остальные пишутся.
+        При недоступности БД строки остаются в очереди до следующей попытки.
+        """
+        async with self._lock:
+            size = self.flush_rows
+            while self._rows:
+                rows = self._rows[:size]
+                try:
+                    await self._write(rows)
+                except Exception as exc:
+                    if not is_bad_row(exc):
+                        logger.exception("inbox writer: flush failed rows=%s", len(rows))
+                        self._trim()
+                        return
+                    if len(rows) > 1:
+                        size = (len(rows) + 1) // 2
+                        continue
+                    logger.error(
+                        "inbox writer: dropping bad row user_id=%s: %s",
+                        rows[0].get("user_id"), exc.orig
+                    )
+                del self._rows[:len(rows)]
+                size = self.flush_rows
+
+    async def _write(self, rows):
+        last_seen = {}
+        for row in rows:
+            user_id, at = row["user_id"], row["created_at"]
+            if user_id not in last_seen or at > last_seen[user_id]:
+                last_seen[user_id] = at
+
+        async with self.session_factory() as session:
+            await session.execute(insert(InboxMessage.__table__).values(rows))
+            await session.execute(
+                _touch_user,
+                [{"b_user_id": user_id, "b_at": at} for user_id, at in last_seen.items()],
+            )
+            await session.commit()
+
+    def _trim(self):
+        overflow = len(self._rows) - self.max_pending
+        if overflow > 0:
+            logger.error("inbox writer: dropping %s oldest rows, queue is full", overflow)
+            del self._rows[:overflow]
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+inbox_writer = InboxWriter()
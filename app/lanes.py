@@ -0,0 +1,99 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.config import UPDATE_LANES, UPDATE_LANE_QUEUE
+
+logger = logging.getLogger(__name__)
+
+
+class ChatLanesMiddleware(BaseMiddleware):
+    """
+    Outer-middleware апдейтов: chat_id хешируется на одну из lanes очередей,
+    каждую очередь разбирает свой воркер. Сообщения одного чата идут строго
+    по порядку (например, текст после /set_tomorrow), разные чаты —
+    параллельно. Очереди ограничены: когда очередь чата заполнена,
+    прием апдейтов ждет (polling не забирает следующую пачку, webhook
+    держит ответ). max_pending — общий предел принятых, но еще не
+    обработанных апдейтов по всем lanes (для webhook — WEBHOOK_CONCURRENCY):
+    middleware возвращается сразу после постановки в очередь, поэтому
+    ограничивать нужно глубину очередей, а не время вызова.
+    """
+
+    def __init__(
+        self,
+        lanes: int = UPDATE_LANES,
+        queue_size: int = UPDATE_LANE_QUEUE,
+        max_pending: int | None = None,
+    ):
+        self.lanes = lanes
+        self.queue_size = queue_size
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(max_pending) if max_pending else None
+        self._pending = 0
+        self._queues = []
+        self._workers = []
+
+    @property
+    def backlog(self) -> int:
+        """
+        Апдейты в очередях и в обработке.
+        """
+        return self._pending
+
+    def _start(self):
+        self._queues = [asyncio.Queue(self.queue_size) for _ in range(self.lanes)]
+        self._workers = [
+            asyncio.create_task(self._work(queue), name=f"update-lane-{index}")
+            for index, queue in enumerate(self._queues)
+        ]
+
+    @staticmethod
+    def lane_key(data: Dict[str, Any]) -> int:
+        chat = data.get("event_chat")
+        if chat is not None:
+            return chat.id
+        user = data.get("event_from_user")
+        return user.id if user is not None else 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not self._workers:
+            self._start()
+        queue = self._queues[self.lane_key(data) % self.lanes]
+        if self._slots is not None:
+            await self._slots.acquire()
+        self._pending += 1
+        await queue.put((handler, event, data))
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            handler, event, data = await queue.get()
+            try:
+                await handler(event, data)
+            except Exception:
+                logger.exception("lanes: update %s failed", getattr(event, "update_id", None))
+            finally:
+                self._pending -= 1
+                if self._slots is not None:
+                    self._slots.release()
+                queue.task_done()
+
+    async def close(self):
+        """
+        Дожидается уже принятых апдейтов и останавливает воркеры.
+        """
+        for queue in self._queues:
+            await queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = []
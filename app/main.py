@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import logging
 import time
@@ -8,17 +9,26 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from pytz import timezone
 from app.config import (
     BOT_TOKEN,
-    SEND_HOUR,
-    SEND_MINUTE,
     REMINDER_HOUR,
     REMINDER_MINUTE,
     TIMEZONE,
     USE_CELERY,
     ENABLE_SCHEDULES,
     REDIS_URL,
+    USER_CACHE_PUBSUB,
+    BOT_MODE,
+    UPDATE_LANES,
+    WEBHOOK_CONCURRENCY,
 )
+from app.admin_state import fsm_storage
 from app.handlers import router
-from app.scheduler import send_daily, send_outbox, send_reminders
+from app.inbox_writer import inbox_writer
+from app.lanes import ChatLanesMiddleware
+from app.outbox import OutboxDispatcher
+from app.rules_cache import listen_rules_changes
+from app.scheduler import send_reminders
+from app.user_cache import listen_invalidations
+from app.webhook import run_webhook
 
 logger = logging.getLogger(__name__)
 
@@ -42,10 +52,24 @@ def redis_is_available(url: str, attempts: int = 5, delay_seconds: float = 1.0)
             time.sleep(delay_seconds)
     return False
 
-async def main():
+async def main(mode: str = BOT_MODE):
     bot = Bot(BOT_TOKEN)
-    dp = Dispatcher()
+    # FSM-middleware не нужен: состояние есть только у админа, и admin_context
+    # читает его сам, без обращения к хранилищу на каждый апдейт
+    dp = Dispatcher(storage=fsm_storage, disable_fsm=True)
     dp.include_router(router)
+    lanes = None
+    if UPDATE_LANES > 0:
+        # порядок внутри чата, параллельность между чатами
+        # webhook: WEBHOOK_CONCURRENCY ограничивает глубину очередей lanes,
+        # иначе слот ответа освобождается сразу после постановки в очередь
+        lanes = ChatLanesMiddleware(
+            max_pending=WEBHOOK_CONCURRENCY if mode == "webhook" else None
+        )
+        dp.update.outer_middleware(lanes)
+        dp.shutdown.register(lanes.close)
+    # дописать накопленные сообщения inbox перед выходом
+    dp.shutdown.register(inbox_writer.close)
 
     use_celery = USE_CELERY
     if USE_CELERY and ENABLE_SCHEDULES and not redis_is_available(REDIS_URL):
@@ -54,19 +78,6 @@ async def main():
 
     if not use_celery and ENABLE_SCHEDULES:
         scheduler = AsyncIOScheduler(timezone=timezone(TIMEZONE))
-        scheduler.add_job(
-            send_daily,
-            "cron",
-            hour=SEND_HOUR,
-            minute=SEND_MINUTE,
-            args=[bot]
-        )
-        scheduler.add_job(
-            send_outbox,
-            "interval",
-            seconds=10,
-            args=[bot]
-        )
         scheduler.add_job(
             send_reminders,
             "cron",
@@ -75,8 +86,31 @@ async def main():
             args=[bot]
         )
         scheduler.start()
+        # ежедневные и отложенные сообщения — одна очередь send_at:
+        # без cron и опроса, по ближайшему send_at и NOTIFY
+        dp["outbox_task"] = asyncio.create_task(OutboxDispatcher(bot).run())
+
+    # правила меняет сидер: сброс кеша правил по NOTIFY
+    dp["rules_cache_task"] = asyncio.create_task(listen_rules_changes())
+
+    if USER_CACHE_PUBSUB:
+        # несколько реплик бота: инвалидации кеша пользователей через Redis
+        dp["user_cache_task"] = asyncio.create_task(listen_invalidations())
 
-    await dp.start_polling(bot)
+    if mode == "webhook":
+        await run_webhook(dp, bot, lanes=lanes)
+    else:
+        # с lanes апдейты только раскладываются по очередям, отдельная задача
+        # на каждый не нужна, а заполненная очередь тормозит getUpdates
+        await dp.start_polling(bot, handle_as_tasks=lanes is None)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Presence bot.")
+    parser.add_argument(
+        "--mode",
+        choices=["polling", "webhook"],
+        default=BOT_MODE,
+        help="polling (getUpdates) or webhook (aiohttp server), default: BOT_MODE",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.mode))
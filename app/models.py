@@ -1,8 +1,9 @@
 from sqlalchemy import (
     Column, Integer, BigInteger, String, Text,
-    Date, DateTime, Boolean, ForeignKey
+    Date, DateTime, Boolean, ForeignKey, Index, LargeBinary, UniqueConstraint
 )
-from sqlalchemy.sql import func
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql import func, text as sql_text
 from app.db import Base
 
 class User(Base):
@@ -16,8 +17,15 @@ class User(Base):
     last_activity_at = Column(DateTime, nullable=True)
     last_inactivity_reminder_at = Column(DateTime, nullable=True)
     last_expiry_reminder_at = Column(DateTime, nullable=True)
+    # NULL — общие TIMEZONE / SEND_HOUR
+    timezone = Column(String, nullable=True)
+    send_hour = Column(Integer, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_users_id_consent", "id", postgresql_where=sql_text("consent IS true")),
+    )
+
 
 class ScheduleMessage(Base):
     __tablename__ = "schedule_messages"
@@ -32,6 +40,23 @@ class ScheduleMessage(Base):
     attempts = Column(Integer, default=0)
     last_attempt_at = Column(DateTime, nullable=True)
     last_error = Column(Text, nullable=True)
+    claimed_by = Column(String, nullable=True)
+    claimed_until = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("day_index", name="uq_schedule_messages_day_index"),
+        Index(
+            "ix_schedule_messages_send_date_unsent",
+            "send_date",
+            postgresql_where=sql_text("sent_at IS NULL"),
+        ),
+        Index(
+            "ix_schedule_messages_send_at_unsent",
+            "send_at",
+            "id",
+            postgresql_where=sql_text("sent_at IS NULL AND send_at IS NOT NULL"),
+        ),
+    )
 
 
 class InboxMessage(Base):
@@ -46,9 +71,22 @@ class InboxMessage(Base):
     action_rule_id = Column(Integer, ForeignKey("action_rules.id"), nullable=True)
     action_status = Column(String, nullable=True)
     action_reviewed_at = Column(DateTime, nullable=True)
-    raw = Column(Text)
+    # полный JSON апдейта (RAW_PAYLOAD_MODE=full/compact) или сжатый (zlib)
+    raw = deferred(Column(Text))
+    raw_payload = deferred(Column(LargeBinary, nullable=True))
     created_at = Column(DateTime, server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_inbox_messages_user_created", "user_id", "created_at"),
+        Index(
+            "ix_inbox_messages_status_created",
+            "action_status",
+            "created_at",
+            "id",
+            postgresql_where=sql_text("action_status IS NOT NULL"),
+        ),
+    )
+
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -58,6 +96,10 @@ class Subscription(Base):
     expires_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_subscriptions_user_id", "user_id"),
+    )
+
 
 class ActionRule(Base):
     __tablename__ = "action_rules"
@@ -79,3 +121,39 @@ class ActionEvent(Base):
     old_expires_at = Column(DateTime, nullable=True)
     new_expires_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_action_events_user_created", "user_id", "created_at"),
+    )
+
+
+class MessageDelivery(Base):
+    __tablename__ = "message_deliveries"
+
+    schedule_message_id = Column(
+        Integer, ForeignKey("schedule_messages.id", ondelete="CASCADE"), primary_key=True
+    )
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    # минута отправки получателю; NULL — сразу
+    due_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index(
+            "ix_message_deliveries_pending_due",
+            "schedule_message_id",
+            "due_at",
+            postgresql_where=sql_text("status = 'pending'"),
+        ),
+    )
+
+
+class SeedMetadata(Base):
+    __tablename__ = "seed_metadata"
+
+    key = Column(String, primary_key=True)
+    content_hash = Column(String, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from datetime import datetime
+
+import asyncpg
+from sqlalchemy import select, func
+
+from app.config import OUTBOX_MAX_IDLE_SECONDS
+from app.db import AsyncSessionLocal, listen_dsn
+from app.models import ScheduleMessage
+from app.scheduler import send_outbox
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_CHANNEL = "schedule_outbox"
+OUTBOX_ERROR_BACKOFF_SECONDS = 10
+
+_dispatcher = None
+
+
+def next_due_query():
+    # сообщение под чужой арендой станет доступно не раньше claimed_until
+    due_at = func.greatest(
+        ScheduleMessage.send_at,
+        func.coalesce(ScheduleMessage.claimed_until, ScheduleMessage.send_at),
+    )
+    return (
+        select(func.min(due_at))
+        .where(ScheduleMessage.sent_at.is_(None))
+        .where(ScheduleMessage.send_at.is_not(None))
+    )
+
+
+async def notify_outbox_changed(session):
+    """
+    NOTIFY внутри транзакции: слушатели получат его только после commit.
+    """
+    await session.execute(select(func.pg_notify(OUTBOX_CHANNEL, "")))
+
+
+def wake_outbox():
+    """
+    Будит диспетчер в этом процессе (вызывать после commit).
+    """
+    if _dispatcher is not None:
+        _dispatcher.wake()
+
+
+class OutboxDispatcher:
+    """
+    Вместо опроса раз в 10 секунд спит до ближайшего send_at
+    (один запрос по частичному индексу) и просыпается сразу, когда
+    сообщение добавили или изменили: wake_outbox() или NOTIFY schedule_outbox.
+    """
+
+    def __init__(self, bot, session_factory=AsyncSessionLocal, max_idle_seconds: float = OUTBOX_MAX_IDLE_SECONDS):
+        self.bot = bot
+        self.session_factory = session_factory
+        self.max_idle_seconds = max_idle_seconds
+        self._event = asyncio.Event()
+        self._listen_conn = None
+
+    def wake(self):
+        self._event.set()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.wake()
+
+    async def _ensure_listener(self):
+        if self._listen_conn is not None and not self._listen_conn.is_closed():
+            return
+        try:
+            self._listen_conn = await asyncpg.connect(listen_dsn())
+            await self._listen_conn.add_listener(OUTBOX_CHANNEL, self._on_notify)
+            logger.info("outbox: listening on %s", OUTBOX_CHANNEL)
+        except Exception as exc:
+            self._listen_conn = None
+            logger.warning(
+                "outbox: LISTEN unavailable, polling every %ss: %s",
+                self.max_idle_seconds, exc
+            )
+
+    async def _next_due(self):
+        async with self.session_factory() as session:
+            return await session.scalar(next_due_query())
+
+    async def _wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=max(0.0, timeout))
+        except asyncio.TimeoutError:
+            pass
+
+    async def run_once(self) -> float:
+        """
+        Отправляет все, что уже пора, и возвращает, сколько можно спать.
+        """
+        due = await self._next_due()
+        now = datetime.utcnow()
+        if due is not None and due <= now:
+            await send_outbox(self.bot, session_factory=self.session_factory)
+            return 0.0
+        if due is None:
+            return self.max_idle_seconds
+        return min(self.max_idle_seconds, (due - now).total_seconds())
+
+    async def run(self):
+        global _dispatcher
+        _dispatcher = self
+        try:
+            while True:
+                await self._ensure_listener()
+                # событие сбрасываем до запроса: изменение во время
+                # run_once не потеряется и разбудит следующий цикл
+                self._event.clear()
+                try:
+                    sleep_for = await self.run_once()
+                except Exception:
+                    logger.exception("outbox: dispatch failed")
+                    sleep_for = OUTBOX_ERROR_BACKOFF_SECONDS
+                if sleep_for > 0:
+                    await self._wait(sleep_for)
+        finally:
+            if _dispatcher is self:
+                _dispatcher = None
+            if self._listen_conn is not None:
+                await self._listen_conn.close()
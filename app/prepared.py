@@ -0,0 +1,71 @@
+import asyncio
+from urllib.parse import urlencode
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import SendMessage
+from aiohttp import ClientError
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+class PreparedMessage:
+    """
+    sendMessage, сериализованный один раз на рассылку: текст, parse_mode,
+    клавиатура и прочие поля (с учетом bot.default) уже лежат в готовом
+    x-www-form-urlencoded теле, на каждый запрос дописывается только chat_id.
+    Запросы идут через общую aiohttp-сессию бота в обход модели aiogram:
+    успешный ответ не разбирается в Message, ошибки поднимаются теми же
+    исключениями aiogram (check_response). Middleware сессии не вызываются.
+    """
+
+    def __init__(self, bot, text: str, **kwargs):
+        self.bot = bot
+        self.text = text
+        # chat_id=0 — заглушка для валидации, в тело не попадает
+        self.method = SendMessage(chat_id=0, text=text, **kwargs)
+        session = bot.session
+        fields = []
+        for key, value in self.method.model_dump(warnings=False).items():
+            if key == "chat_id":
+                continue
+            value = session.prepare_value(value, bot=bot, files={})
+            if not value:
+                continue
+            fields.append((key, value))
+        self.body = urlencode(fields).encode()
+        self.url = session.api.api_url(token=bot.token, method=self.method.__api_method__)
+
+    @staticmethod
+    def supported(bot) -> bool:
+        return isinstance(getattr(bot, "session", None), AiohttpSession)
+
+    def body_for(self, chat_id: int) -> bytes:
+        return b"chat_id=%d&%s" % (chat_id, self.body)
+
+    async def send(self, chat_id: int):
+        session = self.bot.session
+        http = await session.create_session()
+        try:
+            async with http.post(
+                self.url,
+                data=self.body_for(chat_id),
+                headers={"Content-Type": FORM_CONTENT_TYPE},
+                timeout=session.timeout,
+            ) as resp:
+                raw_result = await resp.text()
+        except asyncio.TimeoutError:
+            raise TelegramNetworkError(method=self.method, message="Request timeout error")
+        except ClientError as e:
+            raise TelegramNetworkError(method=self.method, message=f"{type(e).__name__}: {e}")
+
+        try:
+            result = session.json_loads(raw_result)
+        except ValueError:
+            result = None
+        if resp.status == 200 and isinstance(result, dict) and result.get("ok"):
+            return result["result"]
+        # разбор ошибки (RetryAfter, Forbidden, ...) — как в aiogram
+        return session.check_response(
+            bot=self.bot, method=self.method, status_code=resp.status, content=raw_result
+        ).result
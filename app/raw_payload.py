@@ -0,0 +1,115 @@
+import json
+import logging
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app.config import RAW_PAYLOAD_MODE
+from app.models import InboxMessage
+
+logger = logging.getLogger(__name__)
+
+RAW_OFF = "off"
+RAW_FULL = "full"
+RAW_COMPACT = "compact"
+RAW_ZLIB = "zlib"
+RAW_MODES = (RAW_OFF, RAW_FULL, RAW_COMPACT, RAW_ZLIB)
+
+if RAW_PAYLOAD_MODE not in RAW_MODES:
+    logger.warning("raw payload: unknown RAW_PAYLOAD_MODE=%s, using zlib", RAW_PAYLOAD_MODE)
+
+
+def compact_payload(message) -> dict:
+    """
+    Поля, которых хватает для разбора сообщения без полного JSON.
+    """
+    payload = {
+        "message_id": message.message_id,
+        "date": message.date.isoformat() if message.date else None,
+        "chat_id": message.chat.id,
+        "from_id": message.from_user.id if message.from_user else None,
+        "text": message.text,
+        "caption": message.caption,
+        "media_group_id": message.media_group_id,
+        "reply_to_message_id": (
+            message.reply_to_message.message_id if message.reply_to_message else None
+        ),
+    }
+    return {key: value for key, value in payload.items() if value is not None}
+
+
+def compress(data: bytes) -> bytes:
+    return zlib.compress(data, 6)
+
+
+def decompress(blob: bytes) -> bytes:
+    return zlib.decompress(blob)
+
+
+def raw_columns(message, mode: str = RAW_PAYLOAD_MODE) -> dict:
+    """
+    Значения колонок raw / raw_payload для InboxMessage по RAW_PAYLOAD_MODE.
+    """
+    if mode == RAW_OFF:
+        return {"raw": None, "raw_payload": None}
+    if mode == RAW_COMPACT:
+        return {"raw": json.dumps(compact_payload(message), ensure_ascii=False), "raw_payload": None}
+    data = message.model_dump_json(exclude_none=True)
+    if mode == RAW_FULL:
+        return {"raw": data, "raw_payload": None}
+    return {"raw": None, "raw_payload": compress(data.encode())}
+
+
+def decode_raw(raw: str | None, raw_payload: bytes | None) -> dict | None:
+    try:
+        if raw_payload is not None:
+            return json.loads(decompress(raw_payload))
+        if raw:
+            return json.loads(raw)
+    except (ValueError, zlib.error) as exc:
+        logger.warning("raw payload: cannot decode: %s", exc)
+    return None
+
+
+def describe_raw(payload: dict | None) -> str:
+    """
+    Короткая строка для админа из payload (полного или compact): кто
+    прислал, когда, ответ/пересылка. Пустая, если payload нет.
+    """
+    if not payload:
+        return ""
+    parts = []
+    sender = payload.get("from_user") or {}
+    if sender.get("username"):
+        parts.append(f"@{sender['username']}")
+    elif sender.get("first_name"):
+        parts.append(sender["first_name"])
+    elif payload.get("from_id"):
+        parts.append(f"id {payload['from_id']}")
+    sent = payload.get("date")
+    if isinstance(sent, (int, float)):
+        # model_dump_json пишет дату как unix time, compact — как ISO
+        sent = datetime.utcfromtimestamp(sent).isoformat()
+    if sent:
+        parts.append(str(sent).replace("T", " ")[:16])
+    reply_to = payload.get("reply_to_message_id") or (payload.get("reply_to_message") or {}).get("message_id")
+    if reply_to:
+        parts.append(f"ответ на {reply_to}")
+    if payload.get("forward_origin") or payload.get("forward_date"):
+        parts.append("переслано")
+    return ", ".join(parts)
+
+
+async def load_raw(session, inbox_id: int) -> dict | None:
+    """
+    Колонки raw отложены (deferred) и не читаются вместе с InboxMessage;
+    для админских просмотров payload достается и распаковывается отдельно.
+    """
+    row = (await session.execute(
+        select(InboxMessage.raw, InboxMessage.raw_payload)
+        .where(InboxMessage.id == inbox_id)
+    )).first()
+    if not row:
+        return None
+    return decode_raw(row.raw, row.raw_payload)
@@ -0,0 +1,52 @@
+from sqlalchemy import select
+
+from app.config import ADMIN_TG_ID, RECIPIENT_PAGE_SIZE
+from app.db import AsyncSessionLocal
+from app.models import User
+
+
+async def iter_keyset(session_factory, query, key_column, page_size: int = RECIPIENT_PAGE_SIZE):
+    """
+    Постранично (keyset по key_column) отдает строки query.
+    Первая колонка query должна быть key_column. Каждая страница читается
+    в своей короткой сессии, поэтому соединение не висит в транзакции
+    на время рассылки.
+    """
+    last_key = None
+    while True:
+        page = query.order_by(key_column).limit(page_size)
+        if last_key is not None:
+            page = page.where(key_column > last_key)
+        async with session_factory() as session:
+            rows = (await session.execute(page)).all()
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        last_key = rows[-1][0]
+
+
+async def iter_recipients(
+    session_factory=AsyncSessionLocal,
+    exclude_admin: bool = False,
+    page_size: int = RECIPIENT_PAGE_SIZE,
+):
+    """
+    (user_id, tg_chat_id) всех пользователей с consent.
+    """
+    query = select(User.id, User.tg_chat_id).where(User.consent.is_(True))
+    if exclude_admin:
+        query = query.where(User.tg_user_id != ADMIN_TG_ID)
+    async for row in iter_keyset(session_factory, query, User.id, page_size):
+        yield row[0], row[1]
+
+
+async def has_recipients(session, exclude_admin: bool = False) -> bool:
+    query = select(User.id).where(User.consent.is_(True))
+    if exclude_admin:
+        query = query.where(User.tg_user_id != ADMIN_TG_ID)
+    return await session.scalar(query.limit(1)) is not None
+
+
+def consenting_user_ids():
+    return select(User.id).where(User.consent.is_(True))
@@ -0,0 +1,144 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from aiogram.types import (
+    InlineKeyboardMarkup,
+    InlineKeyboardButton,
+    InputMediaPhoto,
+    InputMediaVideo,
+)
+from sqlalchemy import select, tuple_
+
+from app.config import PROOFS_PAGE_SIZE
+from app.models import InboxMessage
+from app.raw_payload import decode_raw, describe_raw
+
+EPOCH = datetime(1970, 1, 1)
+MEDIA_GROUP_MAX = 10
+CAPTION_MAX = 1024
+# лимиты Telegram на inline-клавиатуру: 8 кнопок в ряду, 100 всего
+KEYBOARD_ROW_MAX = 8
+
+Cursor = namedtuple("Cursor", ["created_at", "id"])
+
+
+def encode_cursor(created_at: datetime, inbox_id: int) -> str:
+    # микросекунды + id: в 64 байта callback_data помещается с запасом
+    return f"{(created_at - EPOCH) // timedelta(microseconds=1)}:{inbox_id}"
+
+
+def decode_cursor(raw: str) -> Cursor | None:
+    try:
+        micros, inbox_id = raw.split(":")
+        return Cursor(EPOCH + timedelta(microseconds=int(micros)), int(inbox_id))
+    except (ValueError, OverflowError, TypeError):
+        return None
+
+
+def pending_proofs_query(cursor: Cursor | None = None, limit: int = PROOFS_PAGE_SIZE):
+    """
+    Непроверенные доказательства всех пользователей, от старых к новым,
+    keyset по (created_at, id) — индекс ix_inbox_messages_status_created.
+    """
+    query = (
+        select(
+            InboxMessage.id,
+            InboxMessage.created_at,
+            InboxMessage.text,
+            InboxMessage.media_type,
+            InboxMessage.media_file_id,
+            InboxMessage.action_rule_id,
+            InboxMessage.raw,
+            InboxMessage.raw_payload,
+        )
+        .where(InboxMessage.action_status == "pending")
+        .order_by(InboxMessage.action_status, InboxMessage.created_at, InboxMessage.id)
+        .limit(limit)
+    )
+    if cursor is not None:
+        query = query.where(
+            tuple_(InboxMessage.created_at, InboxMessage.id) > tuple_(cursor.created_at, cursor.id)
+        )
+    return query
+
+
+async def load_pending_proofs(session, cursor: Cursor | None = None, limit: int = PROOFS_PAGE_SIZE):
+    return (await session.execute(pending_proofs_query(cursor, limit))).all()
+
+
+def proof_caption(proof) -> str:
+    details = describe_raw(decode_raw(proof.raw, proof.raw_payload))
+    header = f"#{proof.id} ({details})" if details else f"#{proof.id}"
+    return f"{header} {proof.text or ''}".strip()[:CAPTION_MAX]
+
+
+def media_groups(proofs):
+    """
+    Фото и видео уходят альбомами по 10; кружки в альбом не входят,
+    их отдаем отдельно.
+    """
+    group, singles = [], []
+    for proof in proofs:
+        if proof.media_type == "photo":
+            group.append(InputMediaPhoto(media=proof.media_file_id, caption=proof_caption(proof)))
+        elif proof.media_type == "video":
+            group.append(InputMediaVideo(media=proof.media_file_id, caption=proof_caption(proof)))
+        else:
+            singles.append(proof)
+    batches = [group[i:i + MEDIA_GROUP_MAX] for i in range(0, len(group), MEDIA_GROUP_MAX)]
+    return batches, singles
+
+
+def review_keyboard(proofs, rules_snapshot, next_cursor: str | None) -> InlineKeyboardMarkup:
+    """
+    По строке на доказательство: одобрить выбранным пользователем правилом
+    (или любым активным, если не выбрано) и отклонить. callback_data те же,
+    что у одиночной карточки, их разбирает action_admin. Если правила не
+    помещаются в ряд, вместо них одна кнопка «оценить» — она присылает
+    карточку с правилами по одному в строке.
+    """
+    rows = []
+    for proof in proofs:
+        chosen = rules_snapshot.by_id.get(proof.action_rule_id)
+        rules = [chosen] if chosen else rules_snapshot.rules
+        if len(rules) < KEYBOARD_ROW_MAX:
+            row = [
+                InlineKeyboardButton(
+                    text=f"✅ #{proof.id} {rule.title}",
+                    callback_data=f"action_admin:approve:{rule.id}:{proof.id}",
+                )
+                for rule in rules
+            ]
+        else:
+            row = [InlineKeyboardButton(text=f"✅ оценить #{proof.id}", callback_data=f"action_admin:pick:{proof.id}")]
+        row.append(InlineKeyboardButton(text=f"❌ #{proof.id}", callback_data=f"action_admin:deny:{proof.id}"))
+        rows.append(row)
+    if next_cursor:
+        rows.append([InlineKeyboardButton(text="Дальше", callback_data=f"proofs:{next_cursor}")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def send_review_page(bot, chat_id: int, session_factory, rules_snapshot, cursor: Cursor | None = None):
+    async with session_factory() as session:
+        proofs = await load_pending_proofs(session, cursor)
+    if not proofs:
+        text = "Непроверенных доказательств больше нет." if cursor else "Непроверенных доказательств нет."
+        await bot.send_message(chat_id, text)
+        return 0
+
+    batches, singles = media_groups(proofs)
+    for batch in batches:
+        await bot.send_media_group(chat_id, batch)
+    for proof in singles:
+        if proof.media_type == "video_note":
+            await bot.send_video_note(chat_id, proof.media_file_id)
+        await bot.send_message(chat_id, proof_caption(proof))
+
+    last = proofs[-1]
+    next_cursor = encode_cursor(last.created_at, last.id) if len(proofs) == PROOFS_PAGE_SIZE else None
+    await bot.send_message(
+        chat_id,
+        f"На проверке: {len(proofs)} (#{proofs[0].id}–#{last.id}).",
+        reply_markup=review_keyboard(proofs, rules_snapshot, next_cursor)
+    )
+    return len(proofs)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+import asyncpg
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import select, func
+
+from app.config import RULES_CACHE_TTL_SECONDS
+from app.db import AsyncSessionLocal, listen_dsn
+from app.models import ActionRule
+
+logger = logging.getLogger(__name__)
+
+RULES_CHANNEL = "action_rules_changed"
+
+PROOF_HINT = "Нужны фото/кружок/видео."
+
+TASKS = [
+    "10 минут прогулки",
+    "3 благодарности в дневнике",
+    "15 минут растяжки",
+    "30 минут без соцсетей",
+    "сделала приятный сюрприз",
+]
+
+CachedRule = namedtuple("CachedRule", ["id", "title", "days_to_extend"])
+
+
+def render_rules_text(rules) -> str:
+    if not rules:
+        return "Правила пока не настроены."
+    lines = ["Правила продления:"]
+    for rule in rules:
+        lines.append(f"- {rule.title}: +{rule.days_to_extend} дн.")
+    lines.append(PROOF_HINT)
+    lines.append("Как продлить: отправь фото/кружок/видео, админ подтвердит действие.")
+    lines.append("После отправки выбери действие из списка.")
+    lines.append("Задания:")
+    for task in TASKS:
+        lines.append(f"- {task}")
+    return "\n".join(lines)
+
+
+class RulesSnapshot:
+    """
+    Неизменяемый срез активных правил: текст /rules и заготовки кнопок.
+    Подписи и префиксы callback_data считаются один раз на версию,
+    на каждое доказательство остается только подставить inbox_id.
+    """
+
+    def __init__(self, version: int, rules):
+        self.version = version
+        self.rules = tuple(rules)
+        self.by_id = {rule.id: rule for rule in self.rules}
+        self.text = render_rules_text(self.rules)
+        self._templates = {}
+        for prefix in ("action_admin", "action_user"):
+            self._templates[prefix] = tuple(
+                (
+                    f"{rule.title} (+{rule.days_to_extend} дн.)",
+                    f"{prefix}:approve:{rule.id}:" if prefix == "action_admin" else f"{prefix}:{rule.id}:",
+                )
+                for rule in self.rules
+            )
+
+    def keyboard(self, inbox_id: int, prefix: str, include_deny: bool = False) -> InlineKeyboardMarkup:
+        rows = [
+            [InlineKeyboardButton(text=label, callback_data=f"{data}{inbox_id}")]
+            for label, data in self._templates[prefix]
+        ]
+        if include_deny:
+            rows.append([InlineKeyboardButton(text="Отклонить", callback_data=f"{prefix}:deny:{inbox_id}")])
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+class RulesCache:
+    """
+    Кеш активных ActionRule. Перечитывается после TTL или invalidate()
+    (по NOTIFY action_rules_changed, см. listen_rules_changes); версия
+    растет только если правила действительно поменялись.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, ttl: float = RULES_CACHE_TTL_SECONDS):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self._snapshot = None
+        self._expires_at = 0.0
+
+    def invalidate(self):
+        self._expires_at = 0.0
+
+    async def get(self) -> RulesSnapshot:
+        if self._snapshot is not None and self._expires_at > time.monotonic():
+            return self._snapshot
+
+        async with self.session_factory() as session:
+            rows = (await session.execute(
+                select(ActionRule.id, ActionRule.title, ActionRule.days_to_extend)
+                .where(ActionRule.active.is_(True))
+                .order_by(ActionRule.id)
+            )).all()
+        rules = tuple(CachedRule(*row) for row in rows)
+
+        if self._snapshot is None or self._snapshot.rules != rules:
+            version = self._snapshot.version + 1 if self._snapshot else 1
+            self._snapshot = RulesSnapshot(version, rules)
+            logger.info("rules cache: version=%s rules=%s", version, len(rules))
+        self._expires_at = time.monotonic() + self.ttl
+        return self._snapshot
+
+
+rules_cache = RulesCache()
+
+
+async def notify_rules_changed(session):
+    """
+    Вызывать в транзакции, которая меняет action_rules: после commit
+    кеш сбросится во всех процессах бота.
+    """
+    await session.execute(select(func.pg_notify(RULES_CHANNEL, "")))
+
+
+async def listen_rules_changes(retry_delay_seconds: float = 5.0):
+    """
+    Фоновая задача бота: LISTEN action_rules_changed -> rules_cache.invalidate().
+    Правила пишет сидер (другой процесс), поэтому in-process вызова мало.
+    После переподключения кеш сбрасывается: NOTIFY за время обрыва потерян.
+    """
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(listen_dsn())
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda connection: lost.set())
+            await conn.add_listener(RULES_CHANNEL, lambda *args: rules_cache.invalidate())
+            rules_cache.invalidate()
+            logger.info("rules cache: listening on %s", RULES_CHANNEL)
+            await lost.wait()
+            logger.warning("rules cache: LISTEN connection lost")
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("rules cache: LISTEN error, retry in %ss: %s", retry_delay_seconds, exc)
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(retry_delay_seconds)
@@ -1,16 +1,19 @@
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
-from pytz import timezone
-from sqlalchemy import select
-
-from aiogram.exceptions import (
-    TelegramForbiddenError,
-    TelegramNetworkError,
+from sqlalchemy import (
+    select, update, func, cast, literal, bindparam,
+    and_, or_, any_, exists, true, Date, Integer,
 )
+from sqlalchemy.dialects.postgresql import ARRAY
 
+from app.broadcast import STATUS_SENT, broadcast_text
+from app.claims import claim_messages, release_message, lease_heartbeat, claimable
 from app.db import AsyncSessionLocal
-from app.models import ScheduleMessage, User, Subscription
+from app.deliveries import DeliveryLedger, deliver_schedule_message
+from app.models import ScheduleMessage, User, Subscription, MessageDelivery
+from app.recipients import iter_keyset, has_recipients, consenting_user_ids
+from app.send_plan import local_today, bring_forward_statement
 from app.config import (
     REMINDER_EXPIRES_IN_DAYS,
     REMINDER_INACTIVITY_DAYS,
@@ -19,91 +22,145 @@ from app.config import (
 
 logger = logging.getLogger(__name__)
 
-MSK = timezone("Europe/Moscow")
+REMINDER_FLUSH_SIZE = 500
+# начатое сообщение за вчера еще дорассылается: минуты получателей
+# в западных часовых поясах переходят за полночь TIMEZONE
+STALE_GRACE_DAYS = 1
 
 
-async def send_daily(bot, session_factory=AsyncSessionLocal):
+def stale_message(today: date):
+    """
+    Сообщение за прошедший день, которое уже не отправляем: send_at
+    планируется заранее, и после нескольких дней простоя иначе ушли бы
+    все пропущенные дни сразу. Начатое (есть журнал доставки) дорассылается
+    еще STALE_GRACE_DAYS. Сообщения без send_date (отложенные) не стареют.
     """
-    Отправляет одно ежедневное сообщение (по дате) всем пользователям,
-    у которых consent = true.
+    started = exists().where(MessageDelivery.schedule_message_id == ScheduleMessage.id)
+    return and_(
+        ScheduleMessage.send_date.is_not(None),
+        ScheduleMessage.send_date < today,
+        or_(~started, ScheduleMessage.send_date < today - timedelta(days=STALE_GRACE_DAYS)),
+    )
+
+
+def due_outbox_query(now: datetime, batch_size: int):
+    return (
+        select(ScheduleMessage)
+        .where(ScheduleMessage.sent_at.is_(None))
+        .where(ScheduleMessage.send_at.is_not(None))
+        .where(ScheduleMessage.send_at <= now)
+        .where(~stale_message(local_today(now)))
+        .order_by(ScheduleMessage.send_at, ScheduleMessage.id)
+        .limit(batch_size)
+    )
+
+
+async def skip_stale_messages(session_factory, now_utc: datetime) -> int:
     """
+    Снимает с очереди просроченные сообщения (stale_message): send_at = NULL,
+    last_error = "STALE", чтобы они не висели due и не захватывались.
+    """
+    async with session_factory() as session:
+        result = await session.execute(
+            update(ScheduleMessage)
+            .where(ScheduleMessage.sent_at.is_(None))
+            .where(ScheduleMessage.send_at.is_not(None))
+            .where(ScheduleMessage.send_at <= now_utc)
+            .where(claimable(now_utc))
+            .where(stale_message(local_today(now_utc)))
+            .values(send_at=None, last_error="STALE")
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    if result.rowcount:
+        logger.warning("send_outbox: skipped %s stale messages", result.rowcount)
+    return result.rowcount
 
-    today_msk = datetime.now(MSK).date()
-    now_utc = datetime.utcnow()
 
-    async with session_factory() as session:
+async def finish_outbox(
+    session_factory,
+    msg_id: int,
+    delivered: int,
+    now_utc: datetime,
+    retry_delay_seconds: int = 60,
+    owner=None,
+):
+    # остались получатели с более поздней минутой: ждем ее, sent_at не ставим
+    next_due = await DeliveryLedger(session_factory, msg_id, now=now_utc).next_due()
+    if next_due is not None:
+        await release_message(session_factory, msg_id, owner=owner, send_at=next_due)
+        logger.info(
+            "send_outbox: schedule_id=%s delivered=%s, next bucket at %s",
+            msg_id, delivered, next_due
+        )
+        return
+
+    attempt = {
+        "attempts": func.coalesce(ScheduleMessage.attempts, 0) + 1,
+        "last_attempt_at": now_utc,
+    }
+    if delivered > 0:
+        await release_message(
+            session_factory, msg_id, owner=owner, sent_at=now_utc, last_error=None, **attempt
+        )
+        logger.info(
+            "send_outbox: sent schedule_id=%s to %s users",
+            msg_id, delivered
+        )
+    else:
+        await release_message(
+            session_factory,
+            msg_id,
+            owner=owner,
+            last_error="NO_DELIVERY",
+            send_at=now_utc + timedelta(seconds=retry_delay_seconds),
+            **attempt,
+        )
+        logger.warning(
+            "send_outbox: no deliveries schedule_id=%s",
+            msg_id
+        )
 
-        # 1. Сообщение по расписанию на сегодня
-        msg = await session.scalar(
-            select(ScheduleMessage)
-            .where(ScheduleMessage.send_date == today_msk)
-            .where(ScheduleMessage.sent_at.is_(None))
+
+async def postpone_no_users(session_factory, messages, now_utc: datetime, retry_delay_seconds: int = 60):
+    logger.warning("send_outbox: no consenting users")
+    for msg in messages:
+        await release_message(
+            session_factory,
+            msg.id,
+            send_at=now_utc + timedelta(seconds=retry_delay_seconds),
+            last_error="NO_USERS",
+            last_attempt_at=now_utc,
+            attempts=func.coalesce(ScheduleMessage.attempts, 0) + 1,
         )
 
-        if not msg:
-            logger.info("send_daily: no scheduled message for %s", today_msk)
-            return
 
-        # 2. Все пользователи с consent
-        users = (await session.scalars(
-            select(User).where(User.consent.is_(True))
+async def bring_today_forward(session_factory, now_utc: datetime) -> list[int]:
+    async with session_factory() as session:
+        ids = (await session.scalars(
+            bring_forward_statement(local_today(now_utc), now_utc).returning(ScheduleMessage.id)
         )).all()
+        await session.commit()
+    return ids
 
-        if not users:
-            logger.info("send_daily: no consenting users")
-            return
 
-        delivered = 0
-
-        # 3. Отправка
-        for user in users:
-            try:
-                logger.info(
-                    "send_daily: sending msg_id=%s to user_id=%s chat_id=%s",
-                    msg.id, user.id, user.tg_chat_id
-                )
-
-                await bot.send_message(
-                    chat_id=user.tg_chat_id,
-                    text=msg.text
-                )
-
-                delivered += 1
-
-            except TelegramForbiddenError:
-                logger.warning(
-                    "send_daily: user blocked bot user_id=%s",
-                    user.id
-                )
-                continue
-
-            except TelegramNetworkError as exc:
-                logger.warning(
-                    "send_daily: network error user_id=%s err=%s",
-                    user.id, exc
-                )
-                continue
-
-            except Exception:
-                logger.exception(
-                    "send_daily: unexpected error user_id=%s",
-                    user.id
-                )
-                continue
-
-        # 4. Помечаем отправленным ТОЛЬКО если доставили хотя бы одному
-        if delivered > 0:
-            msg.sent_at = now_utc
-            await session.commit()
-            logger.info(
-                "send_daily: message %s marked sent (%s users)",
-                msg.id, delivered
-            )
-        else:
-            logger.warning(
-                "send_daily: message %s was not delivered to anyone",
-                msg.id
-            )
+async def send_daily(bot, session_factory=AsyncSessionLocal, send_now: bool = False):
+    """
+    Ежедневное сообщение — обычный элемент очереди send_at: его время
+    заранее посчитано app.send_plan, а получатели разложены по своим
+    минутам (due_at в журнале доставки). По расписанию здесь нечего
+    делать, кроме как разобрать очередь.
+    send_now — ручная отправка: сообщение за сегодня уходит сразу всем,
+    без ожидания минут получателей.
+    """
+    now_utc = datetime.utcnow()
+    if send_now:
+        ids = await bring_today_forward(session_factory, now_utc)
+        if not ids:
+            logger.info("send_daily: nothing to bring forward for %s", local_today(now_utc))
+        for msg_id in ids:
+            await DeliveryLedger(session_factory, msg_id).send_all_now(consenting_user_ids())
+    await send_outbox(bot, session_factory=session_factory)
 
 
 async def send_outbox(
@@ -113,178 +170,181 @@ async def send_outbox(
     retry_delay_seconds: int = 60,
 ):
     """
-    Отправляет отложенные сообщения из ScheduleMessage (send_at).
+    Отправляет сообщения из ScheduleMessage, у которых подошел send_at:
+    и ежедневные (send_at планирует app.send_plan), и отложенные.
     Поддерживает retry и логирование.
+    Пачка забирается через FOR UPDATE SKIP LOCKED под аренду, так что
+    несколько воркеров делят очередь без повторных рассылок.
     """
 
     now_utc = datetime.utcnow()
 
+    await skip_stale_messages(session_factory, now_utc)
+    messages = await claim_messages(session_factory, due_outbox_query(now_utc, batch_size))
+
+    if not messages:
+        logger.debug("send_outbox: no messages to send")
+        return
+
     async with session_factory() as session:
+        has_users = await has_recipients(session)
 
-        messages = (await session.scalars(
-            select(ScheduleMessage)
-            .where(ScheduleMessage.sent_at.is_(None))
-            .where(ScheduleMessage.send_at.is_not(None))
-            .where(ScheduleMessage.send_at <= now_utc)
-            .order_by(ScheduleMessage.send_at, ScheduleMessage.id)
-            .limit(batch_size)
-        )).all()
+    if not has_users:
+        await postpone_no_users(session_factory, messages, now_utc, retry_delay_seconds)
+        return
 
-        if not messages:
-            logger.debug("send_outbox: no messages to send")
-            return
+    async with lease_heartbeat(session_factory, [msg.id for msg in messages]):
+        for msg in messages:
+            delivered = await deliver_schedule_message(
+                bot,
+                session_factory,
+                msg.id,
+                msg.text,
+                consenting_user_ids(),
+                log_prefix=f"send_outbox schedule_id={msg.id}",
+                send_date=msg.send_date,
+            )
+            await finish_outbox(
+                session_factory, msg.id, delivered, now_utc, retry_delay_seconds
+            )
 
-        users = (await session.scalars(
-            select(User).where(User.consent.is_(True)).order_by(User.id)
-        )).all()
 
-        if not users:
-            logger.warning("send_outbox: no consenting users")
-            for msg in messages:
-                msg.send_at = now_utc + timedelta(seconds=retry_delay_seconds)
-                msg.last_error = "NO_USERS"
-                msg.last_attempt_at = now_utc
-                msg.attempts = (msg.attempts or 0) + 1
-            await session.commit()
-            return
+def due_reminders_query(now: datetime):
+    """
+    Один запрос: пользователи, которым пора напомнить, с уже посчитанными
+    days_left / inactive_days и флагами, какое напоминание отправлять.
+    """
+    cooldown_edge = now - timedelta(hours=REMINDER_COOLDOWN_HOURS)
+    today = now.date()
+
+    # последняя подписка — LATERAL по ix_subscriptions_user_id для каждого
+    # пользователя страницы, а не GROUP BY по всей таблице на каждой странице
+    sub = (
+        select(func.max(Subscription.expires_at).label("expires_at"))
+        .where(Subscription.user_id == User.id)
+        .lateral("sub")
+    )
+    last_activity = func.coalesce(User.last_activity_at, User.created_at)
+    days_left = cast(sub.c.expires_at, Date) - today
+    inactive_days = literal(today, Date) - cast(last_activity, Date)
+
+    expiry_due = and_(
+        sub.c.expires_at.is_not(None),
+        days_left <= REMINDER_EXPIRES_IN_DAYS,
+        or_(
+            User.last_expiry_reminder_at.is_(None),
+            User.last_expiry_reminder_at <= cooldown_edge,
+        ),
+    )
+    inactivity_due = and_(
+        last_activity.is_not(None),
+        inactive_days >= REMINDER_INACTIVITY_DAYS,
+        or_(
+            User.last_inactivity_reminder_at.is_(None),
+            User.last_inactivity_reminder_at <= cooldown_edge,
+        ),
+    )
+
+    return (
+        select(
+            User.id,
+            User.tg_chat_id,
+            days_left.label("days_left"),
+            inactive_days.label("inactive_days"),
+            expiry_due.label("expiry_due"),
+            inactivity_due.label("inactivity_due"),
+        )
+        .select_from(User)
+        .outerjoin(sub, true())
+        .where(User.consent.is_(True))
+        .where(or_(User.snooze_until.is_(None), User.snooze_until <= now))
+        .where(or_(expiry_due, inactivity_due))
+    )
+
+
+def reminder_text(row) -> str:
+    lines = []
+    if row.expiry_due:
+        days_left = row.days_left
+        if days_left < 0:
+            lines.append("Подписка закончилась. Пришли доказательство, чтобы продлить.")
+        elif days_left == 0:
+            lines.append("Подписка заканчивается сегодня. Пришли доказательство, чтобы продлить.")
+        elif days_left == 1:
+            lines.append("Подписка заканчивается завтра. Пришли доказательство, чтобы продлить.")
+        else:
+            lines.append(
+                f"Подписка заканчивается через {days_left} дн. Пришли доказательство, чтобы продлить."
+            )
+    if row.inactivity_due:
+        lines.append(
+            f"Мы давно не виделись ({row.inactive_days} дн.). Напиши пару слов или пришли доказательство."
+        )
+    return "\n".join(lines)
 
-        for msg in messages:
-            msg.attempts = (msg.attempts or 0) + 1
-            msg.last_attempt_at = now_utc
-
-            delivered = 0
-            for user in users:
-                try:
-                    logger.info(
-                        "send_outbox: sending schedule_id=%s to user_id=%s chat_id=%s",
-                        msg.id, user.id, user.tg_chat_id
-                    )
-
-                    await bot.send_message(
-                        chat_id=user.tg_chat_id,
-                        text=msg.text
-                    )
-                    delivered += 1
-
-                except TelegramForbiddenError:
-                    logger.warning(
-                        "send_outbox: user blocked bot user_id=%s schedule_id=%s",
-                        user.id, msg.id
-                    )
-                    continue
-
-                except TelegramNetworkError as exc:
-                    logger.warning(
-                        "send_outbox: network error schedule_id=%s user_id=%s err=%s",
-                        msg.id, user.id, exc
-                    )
-                    continue
-
-                except Exception:
-                    logger.exception(
-                        "send_outbox: unexpected error schedule_id=%s user_id=%s",
-                        msg.id, user.id
-                    )
-                    continue
-
-            if delivered > 0:
-                msg.sent_at = now_utc
-                msg.last_error = None
-                logger.info(
-                    "send_outbox: sent schedule_id=%s to %s users",
-                    msg.id, delivered
-                )
-            else:
-                msg.last_error = "NO_DELIVERY"
-                msg.send_at = now_utc + timedelta(seconds=retry_delay_seconds)
-                logger.warning(
-                    "send_outbox: no deliveries schedule_id=%s",
-                    msg.id
-                )
 
+async def mark_reminded(session_factory, now: datetime, expiry_ids, inactivity_ids):
+    async with session_factory() as session:
+        if expiry_ids:
+            await session.execute(
+                update(User)
+                .where(User.id == any_(bindparam("ids", expiry_ids, type_=ARRAY(Integer))))
+                .values(last_expiry_reminder_at=now)
+            )
+        if inactivity_ids:
+            await session.execute(
+                update(User)
+                .where(User.id == any_(bindparam("ids", inactivity_ids, type_=ARRAY(Integer))))
+                .values(last_inactivity_reminder_at=now)
+            )
         await session.commit()
 
 
 async def send_reminders(bot, session_factory=AsyncSessionLocal):
     """
     Отправляет напоминания о скором окончании подписки и бездействии.
+    Получатели читаются постранично из due_reminders_query, отметки
+    о напоминаниях обновляются пачками UPDATE по списку id.
     """
     now = datetime.utcnow()
-    cooldown = timedelta(hours=REMINDER_COOLDOWN_HOURS)
-
-    async with session_factory() as session:
-        users = (await session.scalars(
-            select(User).where(User.consent.is_(True)).order_by(User.id)
-        )).all()
-
-        if not users:
-            logger.debug("send_reminders: no consenting users")
+    due = {}
+    expiry_ids = []
+    inactivity_ids = []
+
+    async def recipients():
+        async for row in iter_keyset(session_factory, due_reminders_query(now), User.id):
+            due[row.id] = (row.expiry_due, row.inactivity_due)
+            yield row.id, row.tg_chat_id, reminder_text(row)
+
+    async def flush():
+        nonlocal expiry_ids, inactivity_ids
+        if not expiry_ids and not inactivity_ids:
             return
+        batch_expiry, expiry_ids = expiry_ids, []
+        batch_inactivity, inactivity_ids = inactivity_ids, []
+        await mark_reminded(session_factory, now, batch_expiry, batch_inactivity)
 
-        for user in users:
-            if user.snooze_until and user.snooze_until > now:
-                continue
-
-            sub = await session.scalar(
-                select(Subscription).where(Subscription.user_id == user.id)
-            )
-
-            lines = []
-            update_expiry = False
-            update_inactivity = False
-
-            if sub and sub.expires_at:
-                days_left = (sub.expires_at.date() - now.date()).days
-                needs_expiry = days_left <= REMINDER_EXPIRES_IN_DAYS
-                can_send_expiry = (
-                    not user.last_expiry_reminder_at
-                    or now - user.last_expiry_reminder_at >= cooldown
-                )
-                if needs_expiry and can_send_expiry:
-                    if days_left < 0:
-                        lines.append("Подписка закончилась. Пришли доказательство, чтобы продлить.")
-                    elif days_left == 0:
-                        lines.append("Подписка заканчивается сегодня. Пришли доказательство, чтобы продлить.")
-                    elif days_left == 1:
-                        lines.append("Подписка заканчивается завтра. Пришли доказательство, чтобы продлить.")
-                    else:
-                        lines.append(
-                            f"Подписка заканчивается через {days_left} дн. Пришли доказательство, чтобы продлить."
-                        )
-                    update_expiry = True
-
-            last_activity = user.last_activity_at or user.created_at
-            if last_activity:
-                inactive_days = (now.date() - last_activity.date()).days
-                needs_inactive = inactive_days >= REMINDER_INACTIVITY_DAYS
-                can_send_inactive = (
-                    not user.last_inactivity_reminder_at
-                    or now - user.last_inactivity_reminder_at >= cooldown
-                )
-                if needs_inactive and can_send_inactive:
-                    lines.append(
-                        f"Мы давно не виделись ({inactive_days} дн.). Напиши пару слов или пришли доказательство."
-                    )
-                    update_inactivity = True
-
-            if not lines:
-                continue
-
-            try:
-                await bot.send_message(user.tg_chat_id, "\n".join(lines))
-            except TelegramForbiddenError:
-                logger.warning("send_reminders: user blocked bot user_id=%s", user.id)
-                continue
-            except TelegramNetworkError as exc:
-                logger.warning("send_reminders: network error user_id=%s err=%s", user.id, exc)
-                continue
-            except Exception:
-                logger.exception("send_reminders: unexpected error user_id=%s", user.id)
-                continue
-
-            if update_expiry:
-                user.last_expiry_reminder_at = now
-            if update_inactivity:
-                user.last_inactivity_reminder_at = now
+    async def on_result(user_id, status, error):
+        expiry_due, inactivity_due = due.pop(user_id)
+        if status != STATUS_SENT:
+            return
+        if expiry_due:
+            expiry_ids.append(user_id)
+        if inactivity_due:
+            inactivity_ids.append(user_id)
+        if len(expiry_ids) + len(inactivity_ids) >= REMINDER_FLUSH_SIZE:
+            await flush()
+
+    try:
+        result = await broadcast_text(
+            bot,
+            recipients(),
+            None,
+            log_prefix="send_reminders",
+            on_result=on_result,
+        )
+    finally:
+        await flush()
 
-        await session.commit()
+    if not result.total:
+        logger.debug("send_reminders: nobody to remind")
@@ -1,13 +1,29 @@
 import argparse
 import asyncio
 import csv
+import hashlib
+import json
 from datetime import datetime
 from pathlib import Path
 
-from sqlalchemy import select
+from sqlalchemy import (
+    select, func, tuple_, literal_column,
+    Table, MetaData, Column, Integer, Date, String, Text,
+)
+from sqlalchemy.dialects.postgresql import insert
 
+from app.config import TIMEZONE, SEND_HOUR, SEND_MINUTE
 from app.db import AsyncSessionLocal
-from app.models import ScheduleMessage, ActionRule
+from app.models import ScheduleMessage, ActionRule, SeedMetadata
+from app.rules_cache import rules_cache, notify_rules_changed
+from app.send_plan import replan_schedule
+
+ACTION_RULES = {
+    "smile": ("🙂 Улыбнулась", 30),
+    "circle": ("🎥 Записала кружок", 30),
+    "kiss": ("💋 Поцеловала", 30),
+    "task": ("📝 Выполнила задание", 30),
+}
 
 
 def resolve_csv_path(path: str | None) -> Path:
@@ -24,6 +40,38 @@ def resolve_csv_path(path: str | None) -> Path:
     raise FileNotFoundError("messages_365.csv not found")
 
 
+def content_hash(csv_path: Path) -> str:
+    """
+    sha256 от CSV, конфигурации правил и времени рассылки: если не
+    поменялись, сидер завершается после одного SELECT.
+    """
+    digest = hashlib.sha256()
+    with csv_path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    digest.update(json.dumps(
+        [ACTION_RULES, TIMEZONE, SEND_HOUR, SEND_MINUTE], sort_keys=True, ensure_ascii=False
+    ).encode())
+    return digest.hexdigest()
+
+
+async def stored_hash(key: str, session_factory=AsyncSessionLocal) -> str | None:
+    async with session_factory() as session:
+        return await session.scalar(
+            select(SeedMetadata.content_hash).where(SeedMetadata.key == key)
+        )
+
+
+async def store_hash(key: str, value: str, session_factory=AsyncSessionLocal):
+    stmt = insert(SeedMetadata).values(key=key, content_hash=value, updated_at=func.now())
+    async with session_factory() as session:
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[SeedMetadata.key],
+            set_={"content_hash": stmt.excluded.content_hash, "updated_at": stmt.excluded.updated_at},
+        ))
+        await session.commit()
+
+
 def read_csv_rows(csv_path: Path):
     with csv_path.open(encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -31,56 +79,110 @@ def read_csv_rows(csv_path: Path):
             yield row
 
 
-async def import_csv_if_empty(csv_path: Path):
-    async with AsyncSessionLocal() as session:
-        exists = await session.scalar(select(ScheduleMessage))
-        if exists:
-            return
-
-        for row in read_csv_rows(csv_path):
-            session.add(ScheduleMessage(
-                day_index=int(row["day_index"]),
-                send_date=datetime.fromisoformat(row["date"]).date(),
-                type=row["type"],
-                text=row["text"]
-            ))
+seed_schedule = Table(
+    "seed_schedule",
+    MetaData(),
+    Column("day_index", Integer),
+    Column("send_date", Date),
+    Column("type", String),
+    Column("text", Text),
+    # номер строки CSV: при дублях day_index побеждает последняя
+    Column("row_no", Integer),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+COPY_COLUMNS = [c.name for c in seed_schedule.columns]
+SEED_COLUMNS = [name for name in COPY_COLUMNS if name != "row_no"]
+
+
+def csv_records(csv_path: Path):
+    for row_no, row in enumerate(read_csv_rows(csv_path)):
+        yield (
+            int(row["day_index"]),
+            datetime.fromisoformat(row["date"]).date(),
+            row["type"],
+            row["text"],
+            row_no,
+        )
+
+
+def upsert_statement():
+    """
+    INSERT ... SELECT из временной таблицы с ON CONFLICT (day_index):
+    строка обновляется только если что-то поменялось, иначе не трогается
+    (и не попадает в RETURNING). Из дублей day_index берется последняя
+    строка CSV — детерминированно от запуска к запуску.
+    """
+    source = (
+        select(*(seed_schedule.c[name] for name in SEED_COLUMNS))
+        .distinct(seed_schedule.c.day_index)
+        .order_by(seed_schedule.c.day_index, seed_schedule.c.row_no.desc())
+    )
+    stmt = insert(ScheduleMessage.__table__).from_select(SEED_COLUMNS, source)
+    target = ScheduleMessage.__table__.c
+    return stmt.on_conflict_do_update(
+        index_elements=[target.day_index],
+        set_={
+            "send_date": stmt.excluded.send_date,
+            "type": stmt.excluded.type,
+            "text": stmt.excluded.text,
+        },
+        where=tuple_(target.send_date, target.type, target.text).is_distinct_from(
+            tuple_(stmt.excluded.send_date, stmt.excluded.type, stmt.excluded.text)
+        ),
+    ).returning(literal_column("xmax = 0").label("inserted"))
+
+
+async def sync_csv(csv_path: Path, only_if_empty: bool = False, session_factory=AsyncSessionLocal) -> dict:
+    """
+    CSV -> COPY во временную таблицу -> один upsert. Возвращает счетчики
+    inserted / updated / unchanged.
+    """
+    async with session_factory() as session:
+        if only_if_empty and await session.scalar(select(ScheduleMessage.id).limit(1)):
+            return {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": True}
+
+        conn = await session.connection()
+        await conn.run_sync(lambda sync_conn: seed_schedule.create(sync_conn))
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            seed_schedule.name,
+            records=csv_records(csv_path),
+            columns=COPY_COLUMNS,
+        )
+        total = await session.scalar(
+            select(func.count(func.distinct(seed_schedule.c.day_index)))
+        )
+        changed = (await session.execute(upsert_statement())).scalars().all()
+        # send_at для новых и измененных дат — в той же транзакции
+        planned = await replan_schedule(session)
         await session.commit()
 
+    inserted = sum(1 for is_new in changed if is_new)
+    updated = len(changed) - inserted
+    return {
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": total - len(changed),
+        "planned": planned,
+    }
+
+
+async def import_csv_if_empty(csv_path: Path):
+    return await sync_csv(csv_path, only_if_empty=True)
+
 
 async def upsert_csv(csv_path: Path):
-    async with AsyncSessionLocal() as session:
-        for row in read_csv_rows(csv_path):
-            day_index = int(row["day_index"])
-            send_date = datetime.fromisoformat(row["date"]).date()
-            msg = await session.scalar(
-                select(ScheduleMessage).where(ScheduleMessage.day_index == day_index)
-            )
-            if msg:
-                msg.send_date = send_date
-                msg.type = row["type"]
-                msg.text = row["text"]
-            else:
-                session.add(ScheduleMessage(
-                    day_index=day_index,
-                    send_date=send_date,
-                    type=row["type"],
-                    text=row["text"]
-                ))
-        await session.commit()
+    return await sync_csv(csv_path)
 
 
 async def ensure_action_rules():
     async with AsyncSessionLocal() as session:
-        rules_by_key = {
-            "smile": ("🙂 Улыбнулась", 30),
-            "circle": ("🎥 Записала кружок", 30),
-            "kiss": ("💋 Поцеловала", 30),
-            "task": ("📝 Выполнила задание", 30),
-        }
         existing = (await session.scalars(select(ActionRule))).all()
         existing_by_key = {r.key: r for r in existing}
 
-        for key, (title, days) in rules_by_key.items():
+        for key, (title, days) in ACTION_RULES.items():
             if key in existing_by_key:
                 rule = existing_by_key[key]
                 rule.title = title
@@ -89,7 +191,9 @@ async def ensure_action_rules():
             else:
                 session.add(ActionRule(key=key, title=title, days_to_extend=days))
 
+        await notify_rules_changed(session)
         await session.commit()
+    rules_cache.invalidate()
 
 
 async def main():
@@ -108,11 +212,26 @@ async def main():
 
     csv_path = resolve_csv_path(args.csv)
 
+    # отдельный ключ на режим: import-if-empty не должен «засчитывать» CSV для --update-csv
+    hash_key = "schedule:update" if args.update_csv else "schedule:import"
+    new_hash = content_hash(csv_path)
+    if await stored_hash(hash_key) == new_hash:
+        print("seed: content unchanged, nothing to do")
+        return
+
     if args.update_csv:
-        await upsert_csv(csv_path)
+        counts = await upsert_csv(csv_path)
+    else:
+        counts = await import_csv_if_empty(csv_path)
+    if counts.get("skipped"):
+        print("seed: schedule_messages is not empty, use --update-csv to sync")
     else:
-        await import_csv_if_empty(csv_path)
+        print(
+            f"seed: inserted={counts['inserted']} updated={counts['updated']} "
+            f"unchanged={counts['unchanged']} planned={counts['planned']}"
+        )
     await ensure_action_rules()
+    await store_hash(hash_key, new_hash)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+from datetime import date, datetime, time, timedelta
+
+from pytz import timezone, utc
+from sqlalchemy import select, update, func, case, exists, literal, or_, Interval, Time
+
+from app.config import TIMEZONE, SEND_HOUR, SEND_MINUTE, SEND_BUCKET_SIZE
+from app.models import ScheduleMessage, User, MessageDelivery
+
+LOCAL_TZ = timezone(TIMEZONE)
+SEND_TIME = time(SEND_HOUR, SEND_MINUTE)
+
+
+def local_today(now_utc: datetime | None = None) -> date:
+    now_utc = now_utc or datetime.utcnow()
+    return utc.localize(now_utc).astimezone(LOCAL_TZ).date()
+
+
+def local_tomorrow(now_utc: datetime | None = None) -> date:
+    return local_today(now_utc) + timedelta(days=1)
+
+
+def planned_send_at(send_date: date) -> datetime:
+    """
+    SEND_HOUR:SEND_MINUTE по TIMEZONE в день send_date -> наивный UTC,
+    как остальные DateTime-колонки.
+    """
+    local = LOCAL_TZ.localize(datetime.combine(send_date, SEND_TIME))
+    return local.astimezone(utc).replace(tzinfo=None)
+
+
+def planned_send_at_sql(send_date):
+    # то же в SQL: (date + time) AT TIME ZONE TIMEZONE AT TIME ZONE 'UTC'
+    local = send_date + literal(SEND_TIME, Time)
+    return func.timezone("UTC", func.timezone(TIMEZONE, local))
+
+
+def user_send_at_sql(send_date):
+    """
+    Время отправки пользователю в день send_date: его send_hour в его
+    timezone (NULL — общие настройки), в наивном UTC.
+    """
+    hour = func.coalesce(User.send_hour, SEND_HOUR)
+    local = send_date + func.make_time(hour, SEND_MINUTE, 0)
+    return func.timezone("UTC", func.timezone(func.coalesce(User.timezone, TIMEZONE), local))
+
+
+def custom_send_time():
+    return or_(User.timezone.is_not(None), User.send_hour.is_not(None))
+
+
+def bucketed_due_sql(send_date, bucket_size: int = SEND_BUCKET_SIZE):
+    """
+    due_at получателя: его минута отправки, а если на эту минуту пришлось
+    больше bucket_size человек — следующие минуты по bucket_size
+    (по порядку user_id). Так ни одна минута не превышает глобальный лимит.
+    """
+    slot = user_send_at_sql(send_date)
+    rank = func.row_number().over(partition_by=slot, order_by=User.id) - 1
+    return slot + literal(timedelta(minutes=1), Interval) * (rank // bucket_size)
+
+
+def replan_statement(today: date, from_date: date | None = None):
+    """
+    Один UPDATE: всем неотправленным сообщениям с датой не раньше today
+    ставит send_at по текущим SEND_HOUR/SEND_MINUTE/TIMEZONE, прошедшим —
+    NULL (их не догоняем). Если у кого-то из получателей свое время и оно
+    раньше, send_at — самое раннее из них. Начатые сообщения (есть журнал
+    доставки: send_at указывает на следующую минуту получателей) и ушедшие
+    в retry (attempts > 0) не трогаются, строки с тем же send_at не
+    переписываются.
+    from_date — перепланировать только даты начиная с нее.
+    """
+    table = ScheduleMessage.__table__
+    earliest_custom = (
+        select(func.min(user_send_at_sql(table.c.send_date)))
+        .where(User.consent.is_(True))
+        .where(custom_send_time())
+        .scalar_subquery()
+    )
+    planned = case(
+        (
+            table.c.send_date >= today,
+            func.least(planned_send_at_sql(table.c.send_date), earliest_custom),
+        ),
+        else_=None,
+    )
+    stmt = (
+        update(table)
+        .where(table.c.sent_at.is_(None))
+        .where(func.coalesce(table.c.attempts, 0) == 0)
+        .where(~exists().where(MessageDelivery.schedule_message_id == table.c.id))
+        .where(table.c.send_at.is_distinct_from(planned))
+        .values(send_at=planned)
+    )
+    if from_date is not None:
+        stmt = stmt.where(table.c.send_date >= from_date)
+    return stmt
+
+
+async def replan_schedule(session, now_utc: datetime | None = None, from_date: date | None = None) -> int:
+    result = await session.execute(replan_statement(local_today(now_utc), from_date))
+    return result.rowcount
+
+
+def bring_forward_statement(today: date, now_utc: datetime):
+    """
+    Ручная отправка «за сегодня»: сообщение на today становится due сейчас,
+    а дальше его отправляет та же очередь send_at.
+    """
+    table = ScheduleMessage.__table__
+    return (
+        update(table)
+        .where(table.c.send_date == today)
+        .where(table.c.sent_at.is_(None))
+        .where(or_(table.c.send_at.is_(None), table.c.send_at > now_utc))
+        .values(send_at=now_utc)
+    )
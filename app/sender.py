@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import math
+import time
+
+import redis.asyncio as aioredis
+from aiogram.exceptions import TelegramRetryAfter
+from redis.exceptions import RedisError
+
+from app.config import (
+    REDIS_URL,
+    BROADCAST_SHARED_LIMIT,
+    BROADCAST_GLOBAL_RATE,
+    BROADCAST_PER_CHAT_RATE,
+    BROADCAST_MIN_RATE,
+    BROADCAST_RATE_RECOVERY,
+    SEND_MAX_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Лимит отправок в секунду на процесс (общий для бота — SharedRateLimiter).
+    Токен берется синхронно, без asyncio.Lock: объект не привязан
+    к event loop, хотя в Celery-воркере loop и так один на процесс
+    (app.worker_runtime). После сна ожидающий проверяет токены и паузу
+    заново, так что penalize задерживает и тех, кто уже спит.
+
+    После flood-wait скорость падает вдвое (но не ниже min_rate), а затем
+    линейно восстанавливается на recovery msg/s каждую секунду до max_rate.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float | None = None,
+        min_rate: float | None = None,
+        recovery: float = 0.0,
+    ):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.min_rate = float(min_rate if min_rate is not None else rate)
+        self.recovery = float(recovery)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.recovery and now >= self._paused_until and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + elapsed * self.recovery)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self._paused_until and self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep(max(self._paused_until - now, (1 - self._tokens) / self.rate))
+
+    def penalize(self, retry_after: float):
+        """
+        Пауза на retry_after секунд для всех, кто ждет токен.
+        Скорость снижается один раз на окно паузы: запросы, уже ушедшие
+        до паузы, тоже получат RetryAfter и не должны обрушить rate.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if now >= self._paused_until:
+            self.rate = max(self.min_rate, self.rate / 2)
+        self._paused_until = max(self._paused_until, now + retry_after)
+        # долг в токенах = пауза при текущей скорости
+        self._tokens = min(self._tokens, -(self._paused_until - now) * self.rate)
+
+
+class ChatRateLimiter:
+    """
+    Лимит отправок в один чат: не чаще rate сообщений в секунду.
+    """
+
+    def __init__(self, rate: float, max_chats: int = 100_000):
+        self.interval = 1.0 / float(rate)
+        self.max_chats = max_chats
+        self._next_at = {}
+
+    def _prune(self, now: float):
+        self._next_at = {
+            chat_id: next_at
+            for chat_id, next_at in self._next_at.items()
+            if next_at > now
+        }
+
+    async def acquire(self, chat_id: int):
+        now = time.monotonic()
+        if len(self._next_at) >= self.max_chats:
+            self._prune(now)
+        slot = max(now, self._next_at.get(chat_id, now))
+        self._next_at[chat_id] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+REDIS_RETRY_SECONDS = 30
+
+
+class SharedRateLimiter:
+    """
+    Лимит rate сообщений в секунду на токен бота для всех процессов сразу
+    (Celery-воркеры с -c N, чанки chord, бот): счетчик в Redis на каждую
+    секунду и общая пауза после flood-wait. TokenBucket процесса остается
+    поверх него — сглаживает отправку и снижает скорость после RetryAfter.
+    Если Redis недоступен, остается только лимит процесса.
+    """
+
+    def __init__(self, rate: float, redis_url: str = REDIS_URL, prefix: str = "broadcast_rate"):
+        self.rate = max(1, int(rate))
+        self.redis_url = redis_url
+        self.prefix = prefix
+        self.pause_key = f"{prefix}:pause_until"
+        self._client = None
+        self._down_until = 0.0
+
+    def _redis(self):
+        # один клиент на процесс: у воркера постоянный event loop (worker_runtime)
+        if self._client is None:
+            self._client = aioredis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+        return self._client
+
+    async def acquire(self):
+        if time.monotonic() < self._down_until:
+            return
+        try:
+            while True:
+                now = time.time()
+                client = self._redis()
+                pause_until = await client.get(self.pause_key)
+                if pause_until and float(pause_until) > now:
+                    await asyncio.sleep(float(pause_until) - now)
+                    continue
+                second = int(now)
+                key = f"{self.prefix}:{second}"
+                async with client.pipeline(transaction=True) as pipe:
+                    count, _ = await pipe.incr(key).expire(key, 2).execute()
+                if count <= self.rate:
+                    return
+                await asyncio.sleep(second + 1 - now)
+        except RedisError as exc:
+            # не стучаться в Redis на каждую отправку, пока он лежит
+            self._down_until = time.monotonic() + REDIS_RETRY_SECONDS
+            logger.warning("sender: shared rate limit unavailable, local only: %s", exc)
+
+    async def penalize(self, retry_after: float):
+        try:
+            await self._redis().set(
+                self.pause_key, time.time() + retry_after, ex=math.ceil(retry_after) + 1
+            )
+        except RedisError as exc:
+            logger.warning("sender: shared flood-wait pause not stored: %s", exc)
+
+
+# общие на процесс: все отправки делят один лимит Telegram
+global_limiter = TokenBucket(
+    BROADCAST_GLOBAL_RATE,
+    min_rate=BROADCAST_MIN_RATE,
+    recovery=BROADCAST_RATE_RECOVERY,
+)
+chat_limiter = ChatRateLimiter(BROADCAST_PER_CHAT_RATE)
+# общий на все процессы: токен бота один
+shared_limiter = SharedRateLimiter(BROADCAST_GLOBAL_RATE) if BROADCAST_SHARED_LIMIT else None
+
+
+class BotSender:
+    """
+    Обертка над aiogram.Bot: лимиты Telegram и повтор после flood-wait
+    (TelegramRetryAfter) вместо потери сообщения.
+    """
+
+    def __init__(
+        self,
+        bot,
+        limiter: TokenBucket = global_limiter,
+        per_chat_limiter: ChatRateLimiter = chat_limiter,
+        max_retries: int = SEND_MAX_RETRIES,
+        shared: SharedRateLimiter | None = shared_limiter,
+    ):
+        self.bot = bot
+        self.limiter = limiter
+        self.per_chat_limiter = per_chat_limiter
+        self.shared = shared
+        self.max_retries = max_retries
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        return await self._with_limits(
+            chat_id, lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        )
+
+    async def send_prepared(self, chat_id: int, prepared):
+        """
+        То же для app.prepared.PreparedMessage: тело запроса уже готово.
+        """
+        return await self._with_limits(chat_id, lambda: prepared.send(chat_id))
+
+    async def _with_limits(self, chat_id: int, request):
+        attempt = 0
+        while True:
+            await self.per_chat_limiter.acquire(chat_id)
+            await self.limiter.acquire()
+            if self.shared is not None:
+                await self.shared.acquire()
+            try:
+                return await request()
+            except TelegramRetryAfter as exc:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(
+                    "sender: flood wait %ss chat_id=%s attempt=%s rate=%.1f",
+                    exc.retry_after, chat_id, attempt, self.limiter.rate
+                )
+                self.limiter.penalize(exc.retry_after)
+                if self.shared is not None:
+                    await self.shared.penalize(exc.retry_after)
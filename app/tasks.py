@@ -1,51 +1,73 @@
-import asyncio
+from functools import partial
 
-from aiogram import Bot
+from celery import chord
 import logging
 
 from sqlalchemy import select, func
-from sqlalchemy.ext.asyncio import async_sessionmaker
 
+from app.broadcast import broadcast_text
 from app.celery_app import celery_app
-from app.config import BOT_TOKEN, ADMIN_TG_ID
-from app.db import make_engine
+from app.config import BROADCAST_FANOUT
+from app.fanout import plan_daily, plan_outbox, send_chunk, finish_broadcast
 from app.scheduler import send_daily, send_outbox, send_reminders
-from app.models import User, ScheduleMessage
+from app.models import ScheduleMessage
+from app.recipients import iter_recipients, has_recipients
+from app.worker_runtime import run_with_bot_and_db, run_with_db
 
 logger = logging.getLogger(__name__)
 
 
-async def _run_with_bot(coro):
-    bot = Bot(BOT_TOKEN)
-    try:
-        await coro(bot)
-    finally:
-        await bot.session.close()
-
-async def _run_with_bot_and_db(coro):
-    engine = make_engine()
-    session_factory = async_sessionmaker(engine, expire_on_commit=False)
-    bot = Bot(BOT_TOKEN)
-    try:
-        await coro(bot, session_factory=session_factory)
-    finally:
-        await bot.session.close()
-        await engine.dispose()
+def dispatch_plans(plans):
+    """
+    Для каждого сообщения: chord из чанков по диапазонам user_id
+    и finish_broadcast_task, который снимает аренду и ставит sent_at.
+    """
+    for plan in plans:
+        finish = finish_broadcast_task.s(
+            plan["msg_id"], plan["kind"], plan["owner"], plan["now"]
+        )
+        if not plan["bounds"]:
+            finish.delay([])
+            continue
+        chord(
+            send_chunk_task.s(plan["msg_id"], lo, hi, plan["owner"])
+            for lo, hi in plan["bounds"]
+        )(finish)
 
 
 @celery_app.task(name="app.tasks.send_daily_task")
 def send_daily_task():
-    asyncio.run(_run_with_bot_and_db(send_daily))
+    if BROADCAST_FANOUT:
+        dispatch_plans(run_with_db(plan_daily))
+        return
+    run_with_bot_and_db(send_daily)
 
 
 @celery_app.task(name="app.tasks.send_outbox_task")
 def send_outbox_task():
-    asyncio.run(_run_with_bot_and_db(send_outbox))
+    if BROADCAST_FANOUT:
+        dispatch_plans(run_with_db(plan_outbox))
+        return
+    run_with_bot_and_db(send_outbox)
+
+
+@celery_app.task(name="app.tasks.send_chunk_task")
+def send_chunk_task(msg_id, lo, hi, owner):
+    return run_with_bot_and_db(
+        partial(send_chunk, msg_id=msg_id, lo=lo, hi=hi, owner=owner)
+    )
+
+
+@celery_app.task(name="app.tasks.finish_broadcast_task")
+def finish_broadcast_task(results, msg_id, kind, owner, now):
+    return run_with_db(
+        partial(finish_broadcast, results=results, msg_id=msg_id, kind=kind, owner=owner, now=now)
+    )
 
 
 @celery_app.task(name="app.tasks.send_reminders_task")
 def send_reminders_task():
-    asyncio.run(_run_with_bot_and_db(send_reminders))
+    run_with_bot_and_db(send_reminders)
 
 
 async def send_random(bot, session_factory):
@@ -57,27 +79,21 @@ async def send_random(bot, session_factory):
             logger.warning("send_random: no messages in schedule_messages")
             return 0
 
-        users = (await session.scalars(
-            select(User)
-            .where(User.consent.is_(True))
-            .where(User.tg_user_id != ADMIN_TG_ID)
-            .order_by(User.id)
-        )).all()
-        if not users:
+        if not await has_recipients(session, exclude_admin=True):
             logger.warning("send_random: no consenting users")
             return 0
 
-    delivered = 0
-    for user in users:
-        try:
-            await bot.send_message(user.tg_chat_id, template_msg.text)
-            delivered += 1
-        except Exception:
-            continue
+    result = await broadcast_text(
+        bot,
+        iter_recipients(session_factory, exclude_admin=True),
+        template_msg.text,
+        log_prefix="send_random",
+    )
+    delivered = result.delivered
     logger.info("send_random: delivered to %s users", delivered)
     return delivered
 
 
 @celery_app.task(name="app.tasks.send_random_task")
 def send_random_task():
-    asyncio.run(_run_with_bot_and_db(send_random))
+    run_with_bot_and_db(send_random)
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, namedtuple
+
+import redis.asyncio as aioredis
+from sqlalchemy import select
+
+from app.config import (
+    REDIS_URL,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL_SECONDS,
+    USER_CACHE_PUBSUB,
+)
+from app.db import AsyncSessionLocal
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_CHANNEL = "user_cache_invalidate"
+
+CachedUser = namedtuple("CachedUser", ["id", "tg_chat_id", "consent", "snooze_until"])
+
+# отсутствие пользователя тоже кешируем, чтобы не ходить в БД на каждое
+# сообщение от незнакомых; /start и согласие инвалидируют запись
+_MISSING = object()
+
+
+class UserCache:
+    """
+    LRU + TTL: tg_user_id -> CachedUser.
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+
+    def get(self, tg_user_id: int):
+        item = self._items.get(tg_user_id)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._items[tg_user_id]
+            return None
+        self._items.move_to_end(tg_user_id)
+        return value
+
+    def put(self, tg_user_id: int, value):
+        self._items[tg_user_id] = (value, time.monotonic() + self.ttl)
+        self._items.move_to_end(tg_user_id)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, tg_user_id: int):
+        self._items.pop(tg_user_id, None)
+
+    def clear(self):
+        self._items.clear()
+
+
+user_cache = UserCache()
+_publisher = None
+
+
+async def get_cached_user(tg_user_id: int, session=None) -> CachedUser | None:
+    cached = user_cache.get(tg_user_id)
+    if cached is not None:
+        return None if cached is _MISSING else cached
+
+    query = (
+        select(User.id, User.tg_chat_id, User.consent, User.snooze_until)
+        .where(User.tg_user_id == tg_user_id)
+    )
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            row = (await session.execute(query)).first()
+    else:
+        row = (await session.execute(query)).first()
+
+    value = CachedUser(*row) if row else None
+    user_cache.put(tg_user_id, value if value else _MISSING)
+    return value
+
+
+async def invalidate_user(tg_user_id: int):
+    """
+    Вызывать после commit любого изменения consent / snooze_until / tg_chat_id.
+    С USER_CACHE_PUBSUB=1 инвалидация расходится на все реплики бота.
+    """
+    global _publisher
+    user_cache.invalidate(tg_user_id)
+    if not USER_CACHE_PUBSUB:
+        return
+    try:
+        if _publisher is None:
+            _publisher = aioredis.from_url(REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+        await _publisher.publish(USER_CACHE_CHANNEL, str(tg_user_id))
+    except Exception as exc:
+        logger.warning("user cache: publish failed tg_user_id=%s err=%s", tg_user_id, exc)
+
+
+async def listen_invalidations(retry_delay_seconds: float = 5.0):
+    """
+    Фоновая задача: слушает инвалидации от других реплик.
+    После переподключения кеш сбрасывается целиком — за время
+    обрыва могли потеряться сообщения.
+    """
+    while True:
+        client = aioredis.from_url(REDIS_URL)
+        try:
+            pubsub = client.pubsub()
+            await pubsub.subscribe(USER_CACHE_CHANNEL)
+            user_cache.clear()
+            logger.info("user cache: listening on %s", USER_CACHE_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                try:
+                    user_cache.invalidate(int(message["data"]))
+                except ValueError:
+                    continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("user cache: pubsub error, retry in %ss: %s", retry_delay_seconds, exc)
+        finally:
+            await client.aclose()
+        await asyncio.sleep(retry_delay_seconds)
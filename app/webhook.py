@@ -0,0 +1,141 @@
+"""
+Режим webhook: Telegram присылает апдейты POST-запросами, реплик может
+быть несколько за балансировщиком.
+
+Локальная проверка без Telegram (WEBHOOK_URL пустой, setWebhook не вызывается):
+
+    python -m app.main --mode webhook
+    curl -X POST localhost:8080/telegram/webhook \\
+        -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \\
+        -H "Content-Type: application/json" -d @update.json
+"""
+import asyncio
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from app.config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_CONCURRENCY,
+    WEBHOOK_MAX_CONNECTIONS,
+)
+from app.lanes import ChatLanesMiddleware
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PATH = "/healthz"
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Отвечает Telegram сразу, а апдейт обрабатывает в фоне, но не больше
+    concurrency одновременно. Когда все слоты заняты, ответ задерживается —
+    Telegram сам притормаживает доставку (не больше max_connections
+    запросов в полете), очередь задач в памяти не растет.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, concurrency: int, **kwargs):
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        try:
+            update = await request.json(loads=bot.session.json_loads)
+        except ValueError:
+            return web.Response(body="Bad Request", status=400)
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._feed(bot, update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _feed(self, bot: Bot, update: dict):
+        try:
+            await self._background_feed_update(bot=bot, update=update)
+        except Exception:
+            logger.exception("webhook: update %s failed", update.get("update_id"))
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        if self._background_feed_update_tasks:
+            await asyncio.gather(*self._background_feed_update_tasks, return_exceptions=True)
+
+
+def build_app(
+    dp: Dispatcher,
+    bot: Bot,
+    concurrency: int = WEBHOOK_CONCURRENCY,
+    lanes: ChatLanesMiddleware | None = None,
+) -> web.Application:
+    app = web.Application()
+    handler = BoundedRequestHandler(
+        dp,
+        bot,
+        concurrency=concurrency,
+        secret_token=WEBHOOK_SECRET or None,
+    )
+
+    async def health(request: web.Request) -> web.Response:
+        body = {
+            "status": "ok",
+            "in_flight": handler.in_flight,
+            "concurrency": handler.concurrency,
+        }
+        if lanes is not None:
+            # с lanes in_flight — только постановка в очередь, работа — здесь
+            body["lane_backlog"] = lanes.backlog
+            body["lane_max_pending"] = lanes.max_pending
+        return web.json_response(body)
+
+    async def drain(app: web.Application):
+        await handler.drain()
+
+    # порядок on_shutdown: дождаться принятых апдейтов, shutdown диспетчера,
+    # и только потом закрыть сессию бота (register)
+    app.on_shutdown.append(drain)
+    setup_application(app, dp, bot=bot)
+    handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get(HEALTH_PATH, health)
+    return app
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    if not WEBHOOK_URL:
+        logger.info("webhook: WEBHOOK_URL is empty, setWebhook skipped")
+        return
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+    logger.info("webhook: set to %s%s", WEBHOOK_URL, WEBHOOK_PATH)
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, lanes: ChatLanesMiddleware | None = None):
+    if not WEBHOOK_SECRET:
+        logger.warning("webhook: WEBHOOK_SECRET is empty, requests are not authenticated")
+    dp.startup.register(set_webhook)
+
+    runner = web.AppRunner(build_app(dp, bot, lanes=lanes))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info("webhook: listening on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
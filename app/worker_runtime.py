@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+from aiogram import Bot
+from celery.signals import worker_process_init, worker_process_shutdown
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.config import BOT_TOKEN
+from app.db import make_engine
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerRuntime:
+    """
+    Ресурсы на время жизни процесса Celery-воркера: один event loop,
+    один пул соединений к БД и одна HTTP-сессия Bot.
+    Задачи выполняются в этом loop через run(), поэтому соединения
+    и TLS-сессии переживают задачу и не создаются заново каждый раз.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.engine = None
+        self.session_factory = None
+        self.bot = None
+
+    @property
+    def started(self) -> bool:
+        return self.loop is not None and not self.loop.is_closed()
+
+    def start(self):
+        if self.started:
+            return
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.engine = make_engine()
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.bot = Bot(BOT_TOKEN)
+        logger.info("worker runtime: started")
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def shutdown(self):
+        if not self.started:
+            return
+
+        async def close():
+            await self.bot.session.close()
+            await self.engine.dispose()
+
+        try:
+            self.loop.run_until_complete(close())
+        finally:
+            self.loop.close()
+            self.loop = None
+            self.engine = None
+            self.session_factory = None
+            self.bot = None
+            logger.info("worker runtime: stopped")
+
+
+runtime = WorkerRuntime()
+
+
+@worker_process_init.connect
+def _start_runtime(**kwargs):
+    runtime.start()
+
+
+@worker_process_shutdown.connect
+def _stop_runtime(**kwargs):
+    runtime.shutdown()
+
+
+def run_with_bot_and_db(coro):
+    # solo pool не шлет worker_process_init, поэтому start() еще и лениво
+    runtime.start()
+    return runtime.run(coro(runtime.bot, session_factory=runtime.session_factory))
+
+
+def run_with_db(coro):
+    runtime.start()
+    return runtime.run(coro(session_factory=runtime.session_factory))